@@ -0,0 +1,239 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+import browser_pool
+import endpoints
+import mcp_pool
+import metrics
+from app_logging import get_logger
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests streaming at once per endpoint; per-endpoint overrides, e.g. "web_surfer=1,llm=64"
+DEFAULT_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "32"))
+ENDPOINT_CONCURRENCY = os.getenv("ADMISSION_ENDPOINT_CONCURRENCY", "")
+# Requests allowed to wait for a slot; beyond that new requests are turned away at once
+DEFAULT_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ENDPOINT_QUEUE_SIZES = os.getenv("ADMISSION_ENDPOINT_QUEUE_SIZES", "")
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Retry-After (seconds) sent with 503s
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))
+# Per-client token bucket; 0 disables rate limiting
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+# Header identifying the client (e.g. X-API-Key, or X-Forwarded-For behind a proxy); the peer address otherwise
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+logger = get_logger("admission")
+
+
+def _per_endpoint(value: str):
+    overrides = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            overrides[name.strip()] = int(setting)
+    return overrides
+
+
+def _default_concurrency(endpoint: str):
+    """Endpoints backed by a fixed pool get no more slots than the pool can serve at once.
+
+    That is the browser pool for web_surfer, and the MCP pool for airline_info and
+    flight_info only when their backend is "mcp"; the in-process index backends and
+    every other endpoint get DEFAULT_CONCURRENCY.
+    """
+    if endpoint == "web_surfer":
+        return browser_pool.POOL_SIZE
+    if endpoint in ("airline_info", "flight_info") and endpoints.backend(endpoint) == "mcp":
+        return mcp_pool.POOL_SIZE * mcp_pool.SESSION_MAX_CONCURRENCY
+    return DEFAULT_CONCURRENCY
+
+
+class _Gate:
+    """Concurrency limit for one endpoint with a bounded, time-limited wait queue."""
+
+    def __init__(self, endpoint: str, concurrency: int, queue_size: int):
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.slots = asyncio.Semaphore(concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = Counter()
+
+    def _update_gauges(self):
+        metrics.set_gauge(metrics.ADMISSION_IN_FLIGHT, self.active, endpoint=self.endpoint)
+        metrics.set_gauge(metrics.ADMISSION_QUEUE_DEPTH, self.waiting, endpoint=self.endpoint)
+
+    async def acquire(self):
+        if self.slots.locked():
+            if self.waiting >= self.queue_size:
+                raise self._reject("queue_full")
+            self.waiting += 1
+            self._update_gauges()
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.slots.acquire(), QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout") from None
+            finally:
+                self.waiting -= 1
+                metrics.observe(metrics.ADMISSION_WAIT, time.perf_counter() - started, endpoint=self.endpoint)
+        else:
+            await self.slots.acquire()
+        self.active += 1
+        self.admitted += 1
+        self._update_gauges()
+        return _Ticket(self)
+
+    def release(self):
+        self.active -= 1
+        self.slots.release()
+        self._update_gauges()
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        self._update_gauges()
+        metrics.inc(metrics.ADMISSION_REJECTIONS, endpoint=self.endpoint, reason=reason)
+        logger.warning(
+            "Request rejected", extra={"endpoint": self.endpoint, "reason": reason, "waiting": self.waiting}
+        )
+        return HTTPException(
+            status_code=503,
+            detail=f"{self.endpoint} is at capacity, retry later",
+            headers={"Retry-After": str(RETRY_AFTER)},
+        )
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+class _Ticket:
+    """An admitted request's slot; released exactly once when its stream ends."""
+
+    def __init__(self, gate: _Gate = None):
+        self._gate = gate
+
+    def release(self):
+        gate, self._gate = self._gate, None
+        if gate is not None:
+            gate.release()
+
+
+class _TokenBucket:
+    def __init__(self, now: float):
+        self.tokens = float(RATE_LIMIT_BURST)
+        self.updated = now
+
+    def take(self, now: float):
+        """Take one token; returns 0 on success or the seconds until one is available."""
+        rate = RATE_LIMIT_PER_MINUTE / 60
+        self.tokens = min(RATE_LIMIT_BURST, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+_gates = {}
+# Most recently seen clients last, so the idle ones are dropped first
+_buckets = OrderedDict()
+_rate_limited = Counter()
+
+
+def _gate(endpoint: str):
+    gate = _gates.get(endpoint)
+    if gate is None:
+        concurrency = _per_endpoint(ENDPOINT_CONCURRENCY).get(endpoint, _default_concurrency(endpoint))
+        queue_size = _per_endpoint(ENDPOINT_QUEUE_SIZES).get(endpoint, DEFAULT_QUEUE_SIZE)
+        gate = _gates[endpoint] = _Gate(endpoint, concurrency, queue_size)
+    return gate
+
+
+def client_id(request: Request):
+    if RATE_LIMIT_CLIENT_HEADER:
+        value = request.headers.get(RATE_LIMIT_CLIENT_HEADER)
+        if value:
+            # X-Forwarded-For lists the original client first
+            return value.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _check_rate_limit(endpoint: str, client: str):
+    now = time.monotonic()
+    bucket = _buckets.pop(client, None) or _TokenBucket(now)
+    _buckets[client] = bucket
+    while len(_buckets) > RATE_LIMIT_MAX_CLIENTS:
+        _buckets.popitem(last=False)
+    wait = bucket.take(now)
+    if wait:
+        _rate_limited[endpoint] += 1
+        metrics.inc(metrics.ADMISSION_REJECTIONS, endpoint=endpoint, reason="rate_limited")
+        logger.info("Client rate limited", extra={"endpoint": endpoint, "client": client})
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+def rate_limit(endpoint: str, request: Request):
+    """Raise a 429 HTTPException when the request's client is over its rate limit."""
+    if ADMISSION_ENABLED and RATE_LIMIT_PER_MINUTE > 0:
+        _check_rate_limit(endpoint, client_id(request))
+
+
+async def acquire(endpoint: str):
+    """Take a slot for `endpoint`, waiting in its queue if needed, or raise a 503 HTTPException."""
+    if not ADMISSION_ENABLED:
+        return _Ticket()
+    return await _gate(endpoint).acquire()
+
+
+async def admit(endpoint: str, request: Request):
+    """Rate limit, then take a slot. The ticket must be released once the response is done (see AdmittedStreamingResponse)."""
+    rate_limit(endpoint, request)
+    return await acquire(endpoint)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives back its admission slot when sending ends, however it ends."""
+
+    def __init__(self, ticket: _Ticket, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+
+def admission_stats():
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "queue_timeout": QUEUE_TIMEOUT,
+        "rate_limit_per_minute": RATE_LIMIT_PER_MINUTE,
+        "rate_limited_clients": len(_buckets),
+        "endpoints": {
+            name: {**(_gates[name].stats() if name in _gates else {}), "rate_limited": _rate_limited[name]}
+            for name in sorted(set(_gates) | set(_rate_limited))
+        },
+    }
@@ -0,0 +1,130 @@
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Level for this app's loggers; library loggers (httpx, openai, ...) use LOG_LIBRARY_LEVEL
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LIBRARY_LEVEL = os.getenv("LOG_LIBRARY_LEVEL", "WARNING").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+# Per-endpoint overrides, e.g. "sql_query_copilot=DEBUG,web_surfer=WARNING"
+LOG_ENDPOINT_LEVELS = os.getenv("LOG_ENDPOINT_LEVELS", "")
+# Fraction of DEBUG/INFO records kept; warnings and errors are never sampled out
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Per-endpoint overrides, e.g. "web_surfer=0.1"
+LOG_ENDPOINT_SAMPLE_RATES = os.getenv("LOG_ENDPOINT_SAMPLE_RATES", "")
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "500"))
+
+ROOT_LOGGER = "agents_demo"
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+def _parse_overrides(value: str):
+    overrides = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            overrides[name.strip()] = setting.strip()
+    return overrides
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, endpoint, message and any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with `extra` fields appended as key=value pairs."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = " ".join(f"{key}={value!r}" for key, value in record.__dict__.items() if key not in _RECORD_ATTRS)
+        return f"{line} {fields}" if fields else line
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a random fraction of records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+def setup_logging():
+    """Route all logging through a queue so request handlers never wait on console I/O. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(LOG_LIBRARY_LEVEL)
+    logging.getLogger(ROOT_LOGGER).setLevel(LOG_LEVEL)
+    for endpoint, level in _parse_overrides(LOG_ENDPOINT_LEVELS).items():
+        logging.getLogger(f"{ROOT_LOGGER}.{endpoint}").setLevel(level.upper())
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(endpoint: str):
+    """Return the logger for an endpoint or component, with its sampling rate applied."""
+    logger = logging.getLogger(f"{ROOT_LOGGER}.{endpoint}")
+    if not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        rates = _parse_overrides(LOG_ENDPOINT_SAMPLE_RATES)
+        logger.addFilter(SamplingFilter(float(rates.get(endpoint, LOG_SAMPLE_RATE))))
+    return logger
+
+
+def truncate(value, limit: int = LOG_MAX_FIELD_CHARS):
+    """Cut a payload down to `limit` characters for logging."""
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text)} chars]"
+
+
+def digest(value):
+    """Short content hash, so large payloads can be correlated in logs without being written out."""
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return hashlib.sha256(data).hexdigest()[:16]
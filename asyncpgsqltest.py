@@ -1,139 +1,234 @@
-import asyncpg
+import asyncio
+import csv
+import io
+import json
 import os
-from openai import AsyncOpenAI
+import time
 
 from pydantic import BaseModel
-from pydantic_ai import Agent
+from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.openai import OpenAIProvider
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import disconnect
+import metrics
+import schema_context
+import sql_guardrails
+import sse
+from app_logging import get_logger, truncate
+from db_pool import acquire, init_pool, schema_version
+from llm_clients import get_client, get_model_name
+from response_cache import MemoryCacheBackend, normalize_prompt
+
+# Generated SQL per (schema version, normalized question); entries from an old schema are never looked up again
+TRANSLATION_CACHE_SIZE = int(os.getenv("COPILOT_TRANSLATION_CACHE_SIZE", "500"))
+TRANSLATION_CACHE_TTL = float(os.getenv("COPILOT_TRANSLATION_CACHE_TTL", "0"))
+# Plans of statements that already passed the guardrails' EXPLAIN (which also validates them) for a schema version
+VALIDATED_SQL_CACHE_SIZE = int(os.getenv("COPILOT_VALIDATED_SQL_CACHE_SIZE", "500"))
+
+# SELECT results are read through a server-side cursor and streamed in chunks
+RESULT_FORMAT = os.getenv("COPILOT_RESULT_FORMAT", "text")  # text | json | csv
+CURSOR_PREFETCH = int(os.getenv("COPILOT_CURSOR_PREFETCH", "500"))
+CHUNK_ROWS = int(os.getenv("COPILOT_CHUNK_ROWS", "200"))
+MAX_ROWS = int(os.getenv("COPILOT_MAX_ROWS", "10000"))
+MAX_BYTES = int(os.getenv("COPILOT_MAX_BYTES", str(5 * 1024 * 1024)))
+
+logger = get_logger("sql_query_copilot")
+
 class SQLQuery(BaseModel):
     sql_query: str
     explanation: str
 
-client = AsyncOpenAI(
-    api_key = os.getenv("API_KEY"),
-    base_url = os.getenv("BASE_URL")
-)
-model_name = os.getenv("LLM_MODEL")
-model = OpenAIChatModel(model_name, provider=OpenAIProvider(openai_client=client))
-agent = Agent(
-    model=model,
-    system_prompt="""
-        You are an assistant that generates SQL queries based on user input
-        Database schema:
-        CREATE TABLE IF NOT EXISTS airports
-        (
-            airport_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-            airport_name character varying(100) COLLATE pg_catalog."default" NOT NULL,
-            location character varying(100) COLLATE pg_catalog."default"
-        );
-        CREATE TABLE IF NOT EXISTS pilots
-        (
-            pilot_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-            first_name character varying(50) COLLATE pg_catalog."default" NOT NULL,
-            last_name character varying(50) COLLATE pg_catalog."default" NOT NULL,
-            email character varying(100) COLLATE pg_catalog."default" NOT NULL,
-            phone_number character varying(15) COLLATE pg_catalog."default",
-            hire_date date NOT NULL
-        );
-        CREATE TABLE IF NOT EXISTS flight_delays
-        (
-            flight_delay_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
-            delay_date date NOT NULL,
-            airport_id INTEGER NOT NULL,
-            pilot_id INTEGER NOT NULL,
-            flight_delay_minutes INTEGER NOT NULL,
-            flight_delay_reason character varying(255) COLLATE pg_catalog."default"
-        );
-        Examples:
-        - Input: "List the database tables"
-          Output: SELECT table_name FROM information_schema.tables WHERE table_type = 'BASE TABLE' AND table_schema = 'public';
-        - Input: "List all the columns in the airports table"
-          Output: SELECT column_name FROM information_schema.columns WHERE table_name = 'airports';
-        - Input: "Show me airport locations"
-          Output: SELECT airport_name, location FROM airports;
-        - Input: "Show me flight delays."
-          Output: SELECT delay_date, flight_delay_reason FROM flight_delays;
-    """,
-    output_type=SQLQuery
-)
-
-async def validate_and_execute(sql_query: str):
-    DB_USER = "postgres"
-    DB_PASSWORD = os.getenv("DB_PASSWORD")
-    DB_HOST = "localhost"
-    DB_PORT = "5432"
-    DB_NAME = "postgres"
-    
-    connection_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    conn = await asyncpg.connect(connection_string)
-    try:
-        # First, validate the query
-        await conn.execute(f"EXPLAIN {sql_query}")
-        print("SQL Query is valid.")
-
-        # Check if it's an UPDATE or DELETE operation
-        query_type = sql_query.strip().upper()
-        if query_type.startswith(('UPDATE', 'DELETE', 'INSERT')):
-            # Execute the modification query
-            result = await conn.execute(sql_query)
-            return {"modification": True, "result": result}
-        else:
-            # Execute the SELECT query and fetch results
-            results = await conn.fetch(sql_query)
-            return {"modification": False, "result": results}
-    except Exception as e:
-        print(f"SQL Query validation/execution failed: {e}")
-        return None
-    finally:
-        await conn.close()
+INSTRUCTIONS = """
+    You are an assistant that generates PostgreSQL queries based on user input.
+    Use only the tables and columns in the database schema below.
+"""
+
+
+def _schema_instructions(ctx: RunContext[schema_context.SchemaContext]):
+    # Only the tables and examples related to this question, rebuilt per request
+    return ctx.deps.text
+
+
+_agent = None
+
+
+def get_agent():
+    """Return the shared SQL-writing agent, built on first use."""
+    global _agent
+    if _agent is None:
+        model = OpenAIChatModel(get_model_name(), provider=OpenAIProvider(openai_client=get_client()))
+        _agent = Agent(
+            model=model,
+            instructions=[INSTRUCTIONS, _schema_instructions],
+            deps_type=schema_context.SchemaContext,
+            output_type=SQLQuery,
+        )
+    return _agent
+
+
+_translations = MemoryCacheBackend(max_entries=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL)
+_validated_sql = MemoryCacheBackend(max_entries=VALIDATED_SQL_CACHE_SIZE, ttl=0)
+_stats = {"translation_hits": 0, "translation_misses": 0, "validations": 0, "validation_skips": 0}
+
+
+def _translation_key(message: str, version: str):
+    return (version, get_model_name(), normalize_prompt(message))
+
+
+async def translate(message: str, version: str):
+    """Return the SQLQuery for a question, asking the LLM only if no working translation is cached for this schema."""
+    cached = await _translations.get(_translation_key(message, version))
+    if cached is not None:
+        _stats["translation_hits"] += 1
+        return SQLQuery(**cached)
+    _stats["translation_misses"] += 1
+    context = await schema_context.build(message, version)
+    result = await get_agent().run(message, deps=context)
+    usage = result.usage()
+    metrics.record_tokens("default", get_model_name(), usage.input_tokens, usage.output_tokens)
+    return result.output
+
+
+async def remember_translation(message: str, version: str, sql_result: SQLQuery):
+    """Cache a translation once its SQL has been validated and run, so broken SQL is never replayed."""
+    await _translations.set(_translation_key(message, version), None, sql_result.model_dump())
+
+
+def _row_formatter(result_format: str, columns: list):
+    """Return (header, format_row, footer) for one of the result formats: text, json or csv."""
+    if result_format == "json":
+        def format_row(row, index):
+            return ("," if index else "") + json.dumps(list(row.values()), default=str, separators=(",", ":"))
+        return '{"columns":' + json.dumps(columns, separators=(",", ":")) + ',"rows":[', format_row, "]}"
+    if result_format == "csv":
+        def format_row(row, index):
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerow(row.values())
+            return buffer.getvalue()
+        header = io.StringIO()
+        csv.writer(header, lineterminator="\n").writerow(columns)
+        return header.getvalue(), format_row, ""
+
+    # Get all column values and join with dash separator, one row per line
+    def format_row(row, index):
+        return ("\n" if index else "") + " - ".join(str(value) for value in row.values())
+    return "", format_row, ""
+
+
+async def stream_select(conn, sql_query: str):
+    """Yield a SELECT's rows in formatted chunks from a server-side cursor, stopping at the row/byte caps.
+
+    Cursors only exist inside a transaction, so the caller must have started one.
+    """
+    rows = size = 0
+    chunk = []
+    footer = ""
+    truncated = False
+    # Fetch time excludes the time spent waiting on the client between chunks
+    started = time.perf_counter()
+    streaming_time = 0.0
+    async for row in conn.cursor(sql_query, prefetch=CURSOR_PREFETCH):
+        if rows == 0:
+            header, format_row, footer = _row_formatter(RESULT_FORMAT, list(row.keys()))
+            chunk.append(header)
+        piece = format_row(row, rows)
+        piece_size = len(piece.encode())
+        if rows >= MAX_ROWS or size + piece_size > MAX_BYTES:
+            truncated = True
+            break
+        chunk.append(piece)
+        rows += 1
+        size += piece_size
+        if len(chunk) >= CHUNK_ROWS:
+            yield_started = time.perf_counter()
+            yield sse.token("".join(chunk))
+            streaming_time += time.perf_counter() - yield_started
+            chunk = []
+    metrics.observe(metrics.SQL_STAGE, time.perf_counter() - started - streaming_time, engine="asyncpg", stage="fetch")
+
+    if rows == 0:
+        no_data_message = "Query executed successfully but returned no data."
+        logger.info("Query returned no data")
+        yield sse.token(no_data_message)
+        return
+    chunk.append(footer)
+    yield sse.token("".join(chunk))
+    logger.info("Query results", extra={"rows": rows, "bytes": size, "truncated": truncated})
+    if truncated:
+        yield sse.truncated(rows, size)
+
+
+def copilot_cache_stats():
+    return {
+        **_stats,
+        "translations": _translations.stats()["entries"],
+        "validated_statements": _validated_sql.stats()["entries"],
+        "schema_context": schema_context.context_stats(),
+    }
+
 
 async def run_sql_query_copilot(message: str):
-    # Get SQL query from AI agent
-    result = await agent.run(message)
-    print("AI Generated SQL Query:")
-
-    # Access the SQLQuery object attributes
-    sql_result = result.output
-    print(f"SQL Query: {sql_result.sql_query}")
-    print(f"Explanation: {sql_result.explanation}")
-
-    # Execute the SQL query and get results
-    print("Executing SQL Query...")
-    db_results = await validate_and_execute(sql_result.sql_query)
-
-    if db_results:
-        # Check if it was a modification operation
-        if db_results["modification"]:
-            success_message = f"SQL modification executed successfully: {db_results['result']}"
-            print(success_message)
-            return success_message
-        else:
-            # Handle SELECT query results
-            query_results = db_results["result"]
-            if query_results:
-                print("Query Results:")
-
-                # Extract clean data and store as strings
-                result_strings = []
-                for row in query_results:
-                    # Get all column values and join with dash separator
-                    row_values = [str(value) for value in row.values()]
-                    result_strings.append(" - ".join(row_values))
-
-                # Optionally store as a single string with newlines
-                clean_output = "\n".join(result_strings)
-                print(clean_output)
-                return clean_output
+    version = await schema_version()
+    # Get SQL query from AI agent, or the cached translation of the same question
+    sql_result = await translate(message, version)
+    logger.info(
+        "AI generated SQL query",
+        extra={"sql": truncate(sql_result.sql_query), "explanation": truncate(sql_result.explanation)},
+    )
+    yield sse.tool_call("generate_sql", {"sql_query": sql_result.sql_query, "explanation": sql_result.explanation})
+
+    # Execute the SQL query and stream its results
+    sql_query = sql_result.sql_query
+    streaming = False
+    try:
+        async with acquire() as conn, conn.transaction():
+            # Reads get a LIMIT one row past the stream's cap, so truncation is still reported.
+            # The EXPLAIN also checks the query against the catalog, and runs only the first
+            # time a statement is seen for this schema
+            query = await sql_guardrails.guard(conn, sql_query, MAX_ROWS + 1, plans=_validated_sql, scope=version)
+            sql_query = query.sql
+            if sql_guardrails.SQL_GUARD_ENABLED:
+                _stats["validation_skips" if query.plan_cached else "validations"] += 1
+
+            if query.modifies:
+                # Run as a prepared statement, never conn.execute(): without arguments that uses
+                # the simple query protocol, which runs every statement in the text
+                with metrics.timed(metrics.SQL_STAGE, "sql.execute", engine="asyncpg", stage="execute"):
+                    statement = await conn.prepare(sql_query)
+                    await statement.fetch()
+                result = statement.get_statusmsg()
+                success_message = f"SQL modification executed successfully: {result}"
+                yield sse.no_store()
+                logger.info("SQL modification executed", extra={"status": result})
+                yield sse.token(success_message)
             else:
-                no_data_message = "Query executed successfully but returned no data."
-                print(no_data_message)
-                return no_data_message
-    else:
+                async for event in stream_select(conn, sql_query):
+                    streaming = True
+                    yield event
+        await remember_translation(message, version, sql_result)
+    except asyncio.CancelledError:
+        # asyncpg sends Postgres a cancel request for the running query itself
+        disconnect.reclaimed("sql_query")
+        raise
+    except sql_guardrails.QueryRejected as e:
+        yield sse.no_store()
+        yield sse.token(f"The SQL query was not run: {e}")
+    except Exception as e:
+        logger.warning("SQL query validation/execution failed", extra={"error": str(e), "sql": truncate(sql_query)})
+        if streaming:
+            # Part of the answer was already sent; end the stream with an error frame
+            raise
         error_message = "Failed to execute SQL query."
-        print(error_message)
-        return error_message
\ No newline at end of file
+        yield sse.no_store()
+        yield sse.token(error_message)
+
+
+async def warm_up():
+    """Build the agent, open the connection pool and start loading the token encoding before the first request."""
+    get_agent()
+    schema_context.start_loading_encoding()
+    await init_pool()
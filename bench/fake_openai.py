@@ -0,0 +1,209 @@
+"""Local OpenAI-compatible server for offline benchmarks.
+
+Answers /v1/chat/completions (streaming and not, tool calls, pydantic-ai
+structured output) and /v1/embeddings with canned, deterministic content.
+Latency is configurable so the app can be measured against a realistic
+model without any network:
+
+    FAKE_LLM_TTFT=0.2                 seconds before the first token / response
+    FAKE_LLM_TOKENS_PER_SECOND=50     streaming rate (0 = as fast as possible)
+    FAKE_LLM_ANSWER_WORDS=60          length of the text answer
+    FAKE_SITE_URL=http://127.0.0.1:8766/   URL the web surfer is sent to
+
+    uvicorn bench.fake_openai:app --port 8765
+
+A question containing "SQL: <query>" makes the copilot's structured output
+and the SQL agent's query tool use that query, so specific SQL can be
+benchmarked.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TTFT = float(os.getenv("FAKE_LLM_TTFT", "0.2"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50"))
+ANSWER_WORDS = int(os.getenv("FAKE_LLM_ANSWER_WORDS", "60"))
+SITE_URL = os.getenv("FAKE_SITE_URL", "http://127.0.0.1:8766/")
+DEFAULT_SQL = "SELECT airport_name, location FROM airports"
+# Tools the fake prefers to call when an agent offers several
+PREFERRED_TOOLS = (
+    "sql_db_query", "search_airline_policies", "list_directory", "find_flights", "FlightInfoBot", "visit_url"
+)
+EMBEDDING_DIMENSIONS = 64
+
+_WORDS = (
+    "flight delay gate airport baggage policy carry-on checked fee pilot crew weather departure arrival "
+    "terminal runway connection schedule boarding lounge upgrade refund"
+).split()
+
+app = FastAPI()
+
+
+def _answer():
+    """A bulleted answer of ANSWER_WORDS words, ending with the team termination keyword."""
+    words = [_WORDS[i % len(_WORDS)] for i in range(ANSWER_WORDS)]
+    lines = [" ".join(words[i:i + 8]) for i in range(0, len(words), 8)]
+    return "\n".join(f"- {line}" for line in lines) + "\nTERMINATE"
+
+
+ANSWER = _answer()
+
+
+def _usage(completion_tokens: int):
+    return {"prompt_tokens": 100, "completion_tokens": completion_tokens, "total_tokens": 100 + completion_tokens}
+
+
+def _last_user_text(messages):
+    return str(next((m.get("content") for m in reversed(messages) if m["role"] == "user"), ""))
+
+
+def _sql_from(messages, default=DEFAULT_SQL):
+    text = _last_user_text(messages)
+    start = text.find("SQL:")
+    return text[start + 4:].strip().strip("'\"]}") if start >= 0 else default
+
+
+def _tool_arguments(tool, messages):
+    properties = tool["function"].get("parameters", {}).get("properties", {})
+    arguments = {}
+    for name, schema in properties.items():
+        if "query" in name and tool["function"]["name"].startswith("sql"):
+            arguments[name] = _sql_from(messages, "SELECT count(*) FROM flight_delays")
+        elif "query" in name:
+            arguments[name] = _last_user_text(messages)
+        elif any(option.get("type") == "null" for option in schema.get("anyOf", ())):
+            # Optional parameter
+            arguments[name] = None
+        elif name == "url":
+            arguments[name] = SITE_URL
+        elif name == "path":
+            arguments[name] = "."
+        elif schema.get("type") == "array":
+            arguments[name] = ["Chicago"]
+        elif schema.get("type") in ("integer", "number"):
+            arguments[name] = 1
+        else:
+            arguments[name] = "Chicago"
+    return arguments
+
+
+def _pick_tool(tools):
+    by_name = {tool["function"]["name"]: tool for tool in tools}
+    for name in PREFERRED_TOOLS:
+        if name in by_name:
+            return by_name[name]
+    return tools[0]
+
+
+def _completion(model, message, finish_reason, completion_tokens):
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": _usage(completion_tokens),
+    }
+
+
+def _chunk(completion_id, model, delta, finish_reason=None, usage=None):
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "bench"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body["messages"]
+    tools = body.get("tools") or []
+    model = body.get("model", "fake")
+    stream = body.get("stream", False)
+    await asyncio.sleep(TTFT)
+
+    structured = [tool for tool in tools if tool["function"]["name"].startswith("final_result")]
+    if structured:
+        # pydantic-ai structured output
+        call = {
+            "id": "call_final_result",
+            "type": "function",
+            "function": {
+                "name": structured[0]["function"]["name"],
+                "arguments": json.dumps({"sql_query": _sql_from(messages), "explanation": "Generated by the benchmark LLM."}),
+            },
+        }
+        return JSONResponse(_completion(model, {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls", 20))
+
+    # Call one tool per user turn, then answer once the tool result is in
+    if tools and messages[-1]["role"] != "tool":
+        tool = _pick_tool(tools)
+        call = {
+            "id": f"call_{uuid.uuid4().hex[:8]}",
+            "type": "function",
+            "function": {"name": tool["function"]["name"], "arguments": json.dumps(_tool_arguments(tool, messages))},
+        }
+        if not stream:
+            return JSONResponse(_completion(model, {"role": "assistant", "content": None, "tool_calls": [call]}, "tool_calls", 20))
+
+        async def tool_call_chunks():
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            yield _chunk(completion_id, model, {"role": "assistant", "tool_calls": [dict(index=0, **call)]})
+            yield _chunk(completion_id, model, {}, "tool_calls", _usage(20))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(tool_call_chunks(), media_type="text/event-stream")
+
+    words = ANSWER.split(" ")
+    if not stream:
+        if TOKENS_PER_SECOND:
+            await asyncio.sleep(len(words) / TOKENS_PER_SECOND)
+        return JSONResponse(_completion(model, {"role": "assistant", "content": ANSWER}, "stop", len(words)))
+
+    async def answer_chunks():
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for i, word in enumerate(words):
+            if i and TOKENS_PER_SECOND:
+                await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            yield _chunk(completion_id, model, {"role": "assistant", "content": (" " if i else "") + word})
+        yield _chunk(completion_id, model, {}, "stop", _usage(len(words)))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(answer_chunks(), media_type="text/event-stream")
+
+
+def _embedding(text: str):
+    """Bag-of-words hashed into a small vector, so similar prompts get similar embeddings."""
+    vector = [0.0] * EMBEDDING_DIMENSIONS
+    for word in text.lower().split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIMENSIONS] += 1.0
+    return vector
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": _embedding(str(text))} for i, text in enumerate(inputs)],
+        "model": body.get("model", "fake"),
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    }
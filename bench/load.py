@@ -0,0 +1,362 @@
+"""Load test every streaming endpoint against local stand-ins for its backends.
+
+With --spawn the driver starts everything it needs except Postgres:
+
+  * bench.fake_openai as every LLM profile (LOCAL, EXTERNAL, default),
+  * bench/stub_mcp.py in place of the npx filesystem and Flight Info servers,
+  * a static web server for bench/site as the web surfer's start page,
+  * the app itself (uvicorn main:app),
+
+then fires --requests requests per endpoint with --concurrency in flight
+and reports time to first byte, time to first answer token, total latency
+(p50/p95/p99), throughput, errors and the app's peak RSS. Postgres comes
+from the usual DB_* variables; fill it with bench.seed_postgres first.
+
+    python -m bench.seed_postgres --rows 100000 --reset
+    python -m bench.load --spawn --concurrency 8 --requests 40 --label baseline
+    python -m bench.load --spawn --concurrency 8 --requests 40 --label pooled
+    python -m bench.load --compare bench/results/<baseline>.json bench/results/<pooled>.json
+
+Without --spawn it targets an app already running at --url (RSS is then
+only sampled if --pid is given). Prompts are made unique per request so
+the response cache is bypassed; --repeat-prompts measures cache hits.
+Results are written as JSON to bench/results/.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+ENDPOINTS = {
+    "llm": ("/processLLMfetchRequest", "Summarize the checked baggage policy."),
+    "airline_info": ("/processLLMfetchRequestForAirlineInfo/", "What is the carry-on policy?"),
+    "flight_info": ("/processLLMfetchRequestForFlightInfo/", "When does the flight from Chicago leave?"),
+    "sql_query": ("/processLLMfetchRequestForSQLquery/", "How many flight delays are there?"),
+    "sql_query_copilot": (
+        "/processLLMfetchRequestForSQLqueryCopilot/",
+        "Average delay per airport. SQL: SELECT a.airport_name, avg(d.flight_delay_minutes) FROM flight_delays d "
+        "JOIN airports a USING (airport_id) GROUP BY a.airport_name",
+    ),
+    "web_surfer": ("/processLLMfetchRequestForWebSurfer/", "Find the weather in St. Charles, MO."),
+}
+
+
+def _percentiles(values: list):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+        "mean": statistics.fmean(values), "max": values[-1],
+    }
+
+
+def _rss_bytes(pid: int):
+    """Resident set size of `pid` from /proc (Linux only); None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def _sample_rss(pid: int, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _one_request(client: httpx.AsyncClient, path: str, prompt: str):
+    started = time.perf_counter()
+    result = {"ttfb": None, "ttft": None, "latency": None, "error": None, "bytes": 0}
+    try:
+        async with client.stream("POST", path, json={"userRequestText": prompt}) as response:
+            if response.status_code != 200:
+                await response.aread()
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            event = None
+            async for line in response.aiter_lines():
+                if result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - started
+                result["bytes"] += len(line) + 1
+                if line.startswith("event: "):
+                    event = line[7:]
+                    if event == "token" and result["ttft"] is None:
+                        result["ttft"] = time.perf_counter() - started
+                elif line.startswith("data: ") and event == "error" and result["error"] is None:
+                    result["error"] = line[6:] or "error event"
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["latency"] = time.perf_counter() - started
+    return result
+
+
+async def run_endpoint(url: str, name: str, requests: int, concurrency: int, repeat_prompts: bool, timeout: float):
+    path, prompt = ENDPOINTS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+
+        async def bounded(i):
+            async with semaphore:
+                # Unique prompts defeat the response cache unless asked otherwise
+                return await _one_request(client, path, prompt if repeat_prompts else f"{prompt} (request {i})")
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["error"] is None]
+    errors = [r["error"] for r in results if r["error"] is not None]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "ttfb": _percentiles([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "ttft": _percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency": _percentiles([r["latency"] for r in ok]),
+        "mean_response_bytes": statistics.fmean(r["bytes"] for r in ok) if ok else 0,
+    }
+
+
+class StandIns:
+    """Subprocesses for the fake LLM, the static site and the app under test."""
+
+    def __init__(self, app_port: int, llm_port: int, site_port: int, extra_env: dict):
+        self.app_port = app_port
+        self.llm_port = llm_port
+        self.site_port = site_port
+        self.extra_env = extra_env
+        self.processes = []
+        self.app = None
+
+    def _spawn(self, args, env):
+        process = subprocess.Popen(
+            args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        self.processes.append(process)
+        return process
+
+    def app_env(self):
+        env = dict(os.environ)
+        llm_url = f"http://127.0.0.1:{self.llm_port}/v1"
+        for suffix in ("", "_LOCAL", "_EXTERNAL"):
+            env[f"API_KEY{suffix}"] = "bench"
+            env[f"BASE_URL{suffix}"] = llm_url
+            env[f"LLM_MODEL{suffix}"] = "fake"
+        stub = f"{sys.executable} {os.path.join(ROOT, 'bench', 'stub_mcp.py')}"
+        env["MCP_FILESYSTEM_COMMAND"] = f"{stub} filesystem {os.path.join(ROOT, 'data')}"
+        env["MCP_FLIGHT_INFO_COMMAND"] = f"{stub} flight_info"
+        env["WEB_SURFER_START_PAGE"] = f"http://127.0.0.1:{self.site_port}/"
+        env.setdefault("LOG_LEVEL", "WARNING")
+        env.update(self.extra_env)
+        return env
+
+    async def start(self):
+        await self.start_backends()
+        await self.start_app()
+
+    async def start_backends(self):
+        """Start the fake LLM and the static site."""
+        llm_env = dict(os.environ, FAKE_SITE_URL=f"http://127.0.0.1:{self.site_port}/", **self.extra_env)
+        self._spawn([sys.executable, "-m", "uvicorn", "bench.fake_openai:app", "--port", str(self.llm_port),
+                     "--log-level", "warning"], llm_env)
+        self._spawn([sys.executable, "-m", "http.server", str(self.site_port), "--bind", "127.0.0.1",
+                     "--directory", os.path.join(ROOT, "bench", "site")], dict(os.environ))
+        await self._wait_ready(f"http://127.0.0.1:{self.llm_port}/v1/models")
+
+    async def start_app(self, env: dict = None):
+        """Start the app, with `env` on top of app_env(), and wait until it serves requests."""
+        self.app = self._spawn([sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.app_port),
+                                "--log-level", "warning"], dict(self.app_env(), **(env or {})))
+        await self._wait_ready(f"http://127.0.0.1:{self.app_port}/poolStats")
+
+    def stop_app(self):
+        self.app.terminate()
+        try:
+            self.app.wait(10)
+        except subprocess.TimeoutExpired:
+            self.app.kill()
+        self.processes.remove(self.app)
+        self.app = None
+
+    async def _wait_ready(self, url: str, timeout: float = 120):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if any(p.poll() is not None for p in self.processes):
+                    raise RuntimeError(f"A stand-in process exited before {url} came up")
+                try:
+                    if (await client.get(url)).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.25)
+        raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_report(report: dict):
+    print(f"{'endpoint':<18} {'ok/req':>8} {'rps':>7} {'ttfb p50':>9} {'ttft p50':>9} {'lat p50':>8} {'p95':>8} {'p99':>8}")
+    for name, stats in report["endpoints"].items():
+        def ms(section, key="p50"):
+            return f"{stats[section][key] * 1000:.0f}ms" if stats[section] else "-"
+        print(
+            f"{name:<18} {stats['requests'] - stats['errors']:>3}/{stats['requests']:<4} {stats['throughput_rps']:>7.2f} "
+            f"{ms('ttfb'):>9} {ms('ttft'):>9} {ms('latency'):>8} {ms('latency', 'p95'):>8} {ms('latency', 'p99'):>8}"
+        )
+        for sample in stats["error_samples"]:
+            print(f"    error: {sample[:160]}")
+    rss = report.get("rss")
+    if rss:
+        print(f"app RSS: start {rss['start_mb']:.0f} MB, peak {rss['peak_mb']:.0f} MB, end {rss['end_mb']:.0f} MB")
+
+
+def compare(old_path: str, new_path: str):
+    """Print per-endpoint percentile changes between two saved runs."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['label']} ({old['git_revision']}) -> {new['label']} ({new['git_revision']})")
+    print(f"{'endpoint':<18} {'metric':<14} {'old':>9} {'new':>9} {'change':>8}")
+    for name in sorted(set(old["endpoints"]) & set(new["endpoints"])):
+        a, b = old["endpoints"][name], new["endpoints"][name]
+        rows = [("throughput_rps", a["throughput_rps"], b["throughput_rps"], "")]
+        for section in ("ttfb", "ttft", "latency"):
+            for key in ("p50", "p95", "p99"):
+                if a[section] and b[section]:
+                    rows.append((f"{section} {key}", a[section][key] * 1000, b[section][key] * 1000, "ms"))
+        rows.append(("errors", a["errors"], b["errors"], ""))
+        for metric, before, after, unit in rows:
+            change = f"{(after - before) / before * 100:+.0f}%" if before else "-"
+            print(f"{name:<18} {metric:<14} {before:>7.1f}{unit:<2} {after:>7.1f}{unit:<2} {change:>8}")
+    if old.get("rss") and new.get("rss"):
+        print(f"{'app':<18} {'peak RSS':<14} {old['rss']['peak_mb']:>7.0f}MB {new['rss']['peak_mb']:>7.0f}MB")
+
+
+async def run(args):
+    names = list(ENDPOINTS) if args.endpoints == "all" else args.endpoints.split(",")
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)} (choose from {', '.join(ENDPOINTS)})")
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    stand_ins = None
+    url, pid = args.url, args.pid
+    if args.spawn:
+        stand_ins = StandIns(args.app_port, args.llm_port, args.site_port, extra_env)
+        url, pid = f"http://127.0.0.1:{args.app_port}", None
+    try:
+        if stand_ins:
+            await stand_ins.start()
+            pid = stand_ins.app.pid
+        samples, stop = [], asyncio.Event()
+        sampler = asyncio.create_task(_sample_rss(pid, samples, stop)) if pid else None
+
+        endpoints = {}
+        for name in names:
+            if args.warmup:
+                await run_endpoint(url, name, args.warmup, min(args.warmup, args.concurrency), True, args.timeout)
+            endpoints[name] = await run_endpoint(
+                url, name, args.requests, args.concurrency, args.repeat_prompts, args.timeout
+            )
+
+        stop.set()
+        if sampler:
+            await sampler
+    finally:
+        if stand_ins:
+            stand_ins.stop()
+
+    report = {
+        "label": args.label,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare",)},
+        "endpoints": endpoints,
+        "rss": {
+            "start_mb": samples[0] / 2**20, "peak_mb": max(samples) / 2**20, "end_mb": samples[-1] / 2**20,
+        } if samples else None,
+    }
+    _print_report(report)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-{args.label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {os.path.relpath(path, ROOT)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default="all", help=f"comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests per endpoint first")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--repeat-prompts", action="store_true", help="send identical prompts (response cache hits)")
+    parser.add_argument("--label", default="run", help="name for the results file")
+    parser.add_argument("--spawn", action="store_true", help="start the fake LLM, stub MCP servers, site and app")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="app URL when not spawning")
+    parser.add_argument("--pid", type=int, help="app process id to sample RSS from when not spawning")
+    parser.add_argument("--app-port", type=int, default=8700)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--site-port", type=int, default=8766)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the spawned app and fake LLM, e.g. FAKE_LLM_TTFT=0.5")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two saved result files and exit")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Build, re-index and query times of the policy index over synthetic documents.
+
+Writes --files policy documents of --sections sections each (plus one file
+large enough to be memory-mapped) into a temporary directory, then times a
+full build, a re-scan with nothing changed, an incremental re-index after
+one file changes, and BM25 queries.
+
+    python -m bench.policy_index_benchmark --files 2000 --sections 10
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import policy_index
+
+TOPICS = [
+    ("Carry-On Baggage", "carry-on bag personal item overhead bin dimensions weight"),
+    ("Checked Baggage", "checked bag fee weight limit linear inches additional bags"),
+    ("Excess and Oversized Baggage", "overweight oversized bag fee cargo advance notice"),
+    ("Pets in the Cabin", "pet carrier cabin dog cat kennel fee health certificate"),
+    ("Sports Equipment", "golf bag ski snowboard bicycle surfboard fee case"),
+    ("Delayed Baggage", "delayed lost damaged bag claim report compensation"),
+    ("Musical Instruments", "instrument guitar violin cello seat purchase cabin"),
+    ("Infant Travel", "infant stroller car seat bassinet lap child"),
+]
+FILLER = "passenger ticket fare airport gate crew flight route seat status member service desk".split()
+QUERIES = [
+    "carry-on bag size", "overweight bag fee", "travel with a dog", "ski equipment charges",
+    "lost luggage compensation", "cello seat", "stroller at the gate", "how many checked bags",
+]
+
+
+def _document(rng: random.Random, airline: int, sections: int):
+    parts = [f"Airline {airline} Policy Handbook"]
+    for _ in range(sections):
+        title, words = rng.choice(TOPICS)
+        body = " ".join(rng.choice(words.split() + FILLER) for _ in range(rng.randint(40, 120)))
+        parts.append(f"* {title}\n\n{body}")
+    return "\n\n-----\n\n".join(parts) + "\n"
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        for airline in range(args.files):
+            with open(os.path.join(directory, f"policy_{airline:05d}.txt"), "w") as f:
+                f.write(_document(rng, airline, args.sections))
+        large_sections = policy_index.POLICY_MMAP_MIN_BYTES // 400 + 1
+        with open(os.path.join(directory, "large_policy.txt"), "w") as f:
+            f.write(_document(rng, args.files, large_sections))
+
+        index = policy_index.PolicyIndex(directory)
+        build, _ = _timed(index.refresh, True)
+        stats = index.stats()
+        print(f"build:       {build:.2f}s for {stats['files']} files, {stats['sections']} sections, {stats['terms']} terms")
+        rescan, _ = _timed(index.refresh, True)
+        print(f"re-scan:     {rescan * 1000:.1f}ms (nothing changed)")
+
+        changed = os.path.join(directory, "policy_00000.txt")
+        with open(changed, "a") as f:
+            f.write("\n-----\n\n* Unaccompanied Minors\n\nminor escort fee age form\n")
+        incremental, _ = _timed(index.refresh, True)
+        print(f"incremental: {incremental * 1000:.1f}ms (one file changed)")
+
+        latencies = []
+        for i in range(args.queries):
+            elapsed, hits = _timed(index.search, QUERIES[i % len(QUERIES)], policy_index.POLICY_TOP_K)
+            latencies.append(elapsed)
+        latencies.sort()
+        print(
+            f"search:      p50 {statistics.median(latencies) * 1000:.2f}ms, "
+            f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:.2f}ms over {args.queries} queries"
+        )
+        _, hits = _timed(index.search, "unaccompanied minor escort", 1)
+        print(f"top hit for the new section: {os.path.basename(hits[0][1].path)}, section {hits[0][1].number + 1}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Create and fill the airports/pilots/flight_delays tables with synthetic data.
+
+Uses the database configured for the app (DB_USER, DB_PASSWORD, DB_HOST,
+DB_PORT, DB_NAME). Rows are generated server-side with generate_series,
+so 10^7 flight delays take seconds, not a client-side loop:
+
+    python -m bench.seed_postgres --rows 1000000 --reset
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+
+from db_pool import connection_string
+
+# Same tables the copilot's system prompt describes
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS airports
+(
+    airport_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    airport_name character varying(100) NOT NULL,
+    location character varying(100)
+);
+CREATE TABLE IF NOT EXISTS pilots
+(
+    pilot_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    first_name character varying(50) NOT NULL,
+    last_name character varying(50) NOT NULL,
+    email character varying(100) NOT NULL,
+    phone_number character varying(15),
+    hire_date date NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flight_delays
+(
+    flight_delay_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    delay_date date NOT NULL,
+    airport_id INTEGER NOT NULL,
+    pilot_id INTEGER NOT NULL,
+    flight_delay_minutes INTEGER NOT NULL,
+    flight_delay_reason character varying(255)
+);
+"""
+
+AIRPORTS = [
+    ("O'Hare International", "Chicago"), ("Los Angeles International", "Los Angeles"),
+    ("John F. Kennedy International", "New York"), ("Miami International", "Miami"),
+    ("San Francisco International", "San Francisco"), ("Seattle-Tacoma International", "Seattle"),
+    ("Logan International", "Boston"), ("Dallas/Fort Worth International", "Dallas"),
+    ("Hartsfield-Jackson Atlanta International", "Atlanta"), ("Denver International", "Denver"),
+    ("St. Louis Lambert International", "St. Louis"), ("Phoenix Sky Harbor International", "Phoenix"),
+]
+
+PILOTS_SQL = """
+INSERT INTO pilots (first_name, last_name, email, phone_number, hire_date)
+SELECT (ARRAY['Amy','Ben','Carla','Dev','Elena','Frank','Grace','Hiro'])[1 + g % 8],
+       (ARRAY['Lee','Martinez','Okafor','Novak','Smith','Tanaka','Weber','Young'])[1 + (g / 8) % 8],
+       'pilot' || g || '@example.com',
+       '555-' || lpad((g % 10000)::text, 4, '0'),
+       date '2005-01-01' + (g * 13) % 7000
+FROM generate_series(1, $1) g
+"""
+
+DELAYS_SQL = """
+INSERT INTO flight_delays (delay_date, airport_id, pilot_id, flight_delay_minutes, flight_delay_reason)
+SELECT date '2020-01-01' + (g % 1800)::integer,
+       1 + g % $3,
+       1 + (g * 7) % $4,
+       5 + (g * 37) % 235,
+       (ARRAY['weather','crew','maintenance','air traffic control','late aircraft'])[1 + (g * 11) % 5]
+FROM generate_series($1::bigint, $2::bigint) g
+"""
+
+BATCH_ROWS = 1_000_000
+
+
+async def seed(rows: int, reset: bool):
+    conn = await asyncpg.connect(connection_string)
+    try:
+        await conn.execute(SCHEMA)
+        if reset:
+            await conn.execute("TRUNCATE airports, pilots, flight_delays RESTART IDENTITY")
+        if not await conn.fetchval("SELECT count(*) FROM airports"):
+            await conn.executemany("INSERT INTO airports (airport_name, location) VALUES ($1, $2)", AIRPORTS)
+        airports = await conn.fetchval("SELECT count(*) FROM airports")
+        pilots = max(10, rows // 1000)
+        existing_pilots = await conn.fetchval("SELECT count(*) FROM pilots")
+        if existing_pilots < pilots:
+            await conn.execute(PILOTS_SQL.replace("generate_series(1, $1)", f"generate_series({existing_pilots + 1}, $1)"), pilots)
+
+        existing = await conn.fetchval("SELECT count(*) FROM flight_delays")
+        started = time.perf_counter()
+        for first in range(existing + 1, rows + 1, BATCH_ROWS):
+            last = min(rows, first + BATCH_ROWS - 1)
+            await conn.execute(DELAYS_SQL, first, last, airports, pilots)
+            print(f"flight_delays: {last:,}/{rows:,} rows ({time.perf_counter() - started:.1f}s)")
+        await conn.execute("ANALYZE airports, pilots, flight_delays")
+        counts = await conn.fetchrow(
+            "SELECT (SELECT count(*) FROM airports) AS airports, (SELECT count(*) FROM pilots) AS pilots, "
+            "(SELECT count(*) FROM flight_delays) AS flight_delays"
+        )
+        print(dict(counts))
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000, help="flight_delays rows (10^3 to 10^7)")
+    parser.add_argument("--reset", action="store_true", help="truncate the tables first")
+    args = parser.parse_args()
+    asyncio.run(seed(args.rows, args.reset))
+
+
+if __name__ == "__main__":
+    main()
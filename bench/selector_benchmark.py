@@ -0,0 +1,82 @@
+"""Selection quality and speed of the web surfer's message selector.
+
+Runs every labelled case in bench/fixtures/selector_cases.json through the
+local scorer from message_selector and reports accuracy, how often the
+scorer would defer to the LLM, and the time per selection. With --llm the
+same cases also go through select_message() against the configured LOCAL
+model in "auto" and "llm" modes, so end-to-end quality and latency can be
+compared with the old always-LLM behaviour.
+
+    python -m bench.selector_benchmark
+    python -m bench.selector_benchmark --llm
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from message_selector import rank_messages, select_message, strip_terminate
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "selector_cases.json")
+
+
+def _load_cases(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _bench_scorer(cases, repeat: int):
+    correct = ambiguous = 0
+    for case in cases:
+        candidates, is_ambiguous = rank_messages(case["messages"])
+        ok = candidates[0].index == case["expected"]
+        correct += ok
+        ambiguous += is_ambiguous
+        flags = ("" if ok else " WRONG") + (" ambiguous" if is_ambiguous else "")
+        print(f"  {case['name']}: picked {candidates[0].index}, expected {case['expected']}{flags}")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            rank_messages(case["messages"])
+    per_selection_us = (time.perf_counter() - started) / (repeat * len(cases)) * 1e6
+    print(
+        f"scorer: {correct}/{len(cases)} correct, {ambiguous} ambiguous (would call the LLM in auto mode), "
+        f"{per_selection_us:.1f} us per selection"
+    )
+
+
+async def _bench_mode(cases, mode: str):
+    correct = llm_calls = 0
+    latencies = []
+    for case in cases:
+        expected = strip_terminate(case["messages"][case["expected"]]).strip()
+        started = time.perf_counter()
+        text, method = await select_message(case["messages"], mode=mode)
+        latencies.append(time.perf_counter() - started)
+        correct += text.strip() == expected
+        llm_calls += method == "llm"
+    latencies.sort()
+    print(
+        f"{mode}: {correct}/{len(cases)} correct, {llm_calls} LLM calls, "
+        f"median {latencies[len(latencies) // 2] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--repeat", type=int, default=1000, help="timing iterations over the whole fixture set")
+    parser.add_argument("--llm", action="store_true", help="also run the auto and llm modes against the LOCAL model")
+    args = parser.parse_args()
+
+    cases = _load_cases(args.fixtures)
+    _bench_scorer(cases, args.repeat)
+    if args.llm:
+        for mode in ("auto", "llm"):
+            asyncio.run(_bench_mode(cases, mode))
+
+
+if __name__ == "__main__":
+    main()
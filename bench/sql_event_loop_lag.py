@@ -0,0 +1,80 @@
+"""Event-loop lag while the LangChain SQL tools run slow queries.
+
+Runs the same batch of `pg_sleep` queries twice against the configured
+Postgres: once calling SQLDatabase directly on the event loop (what a
+synchronous tool does) and once through the offloaded sql_db_query tool
+from langchainsqltest, while a ticker measures how late the loop wakes up.
+
+    python -m bench.sql_event_loop_lag --concurrency 8 --query-seconds 0.2
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import create_engine
+
+from db_pool import connection_string
+from langchainsqltest import OffloadedQuerySQLDatabaseTool
+
+TICK_SECONDS = 0.01
+
+
+async def _sample_lag(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _run_mode(mode: str, db: SQLDatabase, args):
+    query = f"SELECT pg_sleep({args.query_seconds})"
+    tool = OffloadedQuerySQLDatabaseTool(db=db)
+
+    async def one_query():
+        if mode == "inline":
+            db.run_no_throw(query)
+        else:
+            await tool.ainvoke(query)
+
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(_sample_lag(samples, stop))
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        await asyncio.gather(*(one_query() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+    return {
+        "mode": mode,
+        "queries": args.rounds * args.concurrency,
+        "elapsed_s": elapsed,
+        "lag_p50_ms": statistics.median(samples) * 1000,
+        "lag_p99_ms": _percentile(samples, 99) * 1000,
+        "lag_max_ms": max(samples) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--query-seconds", type=float, default=0.2)
+    args = parser.parse_args()
+
+    db = SQLDatabase(create_engine(connection_string), lazy_table_reflection=True)
+    print(f"{'mode':<8} {'queries':>7} {'elapsed s':>9} {'lag p50 ms':>10} {'lag p99 ms':>10} {'lag max ms':>10}")
+    for mode in ("inline", "offload"):
+        r = await _run_mode(mode, db, args)
+        print(f"{r['mode']:<8} {r['queries']:>7} {r['elapsed_s']:>9.2f} {r['lag_p50_ms']:>10.1f} {r['lag_p99_ms']:>10.1f} {r['lag_max_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
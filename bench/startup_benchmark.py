@@ -0,0 +1,142 @@
+"""Startup time and memory of the app, eager versus lazily loaded endpoints.
+
+Starts the fake LLM, stub MCP servers and static site (as bench.load --spawn
+does), then for each scenario starts the app --repeat times and reports the
+time from process start until it answers /poolStats, its RSS at that point,
+and optionally (--first-requests) the latency of the first request to each
+enabled endpoint and the RSS after them.
+
+Scenarios:
+
+  * eager: PREWARM_ENDPOINTS=all, every framework loaded at startup
+  * lazy: the default, frameworks loaded by each endpoint's first request
+  * only:<endpoint>: ENABLED_ENDPOINTS and PREWARM_ENDPOINTS set to that one endpoint
+
+    python -m bench.startup_benchmark --repeat 3
+    python -m bench.startup_benchmark --scenarios lazy,only:sql_query --first-requests
+
+Results are written as JSON to bench/results/.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from bench.load import ENDPOINTS, RESULTS_DIR, ROOT, StandIns, _git_revision, _one_request, _rss_bytes
+
+DEFAULT_SCENARIOS = ["eager", "lazy"] + [f"only:{name}" for name in ENDPOINTS]
+
+
+def scenario_env(scenario: str):
+    if scenario == "eager":
+        return {"ENABLED_ENDPOINTS": "all", "PREWARM_ENDPOINTS": "all"}
+    if scenario == "lazy":
+        return {"ENABLED_ENDPOINTS": "all", "PREWARM_ENDPOINTS": ""}
+    if scenario.startswith("only:") and scenario[5:] in ENDPOINTS:
+        return {"ENABLED_ENDPOINTS": scenario[5:], "PREWARM_ENDPOINTS": scenario[5:]}
+    raise SystemExit(f"Unknown scenario {scenario!r} (choose from {', '.join(DEFAULT_SCENARIOS)})")
+
+
+def _enabled(env: dict):
+    return list(ENDPOINTS) if env["ENABLED_ENDPOINTS"] == "all" else env["ENABLED_ENDPOINTS"].split(",")
+
+
+async def run_once(stand_ins: StandIns, env: dict, first_requests: bool, timeout: float):
+    started = time.perf_counter()
+    await stand_ins.start_app(env)
+    result = {"startup": time.perf_counter() - started, "rss_mb": _rss_bytes(stand_ins.app.pid) / 2**20}
+    if first_requests:
+        result["first_request"] = {}
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{stand_ins.app_port}", timeout=timeout) as client:
+            for name in _enabled(env):
+                path, prompt = ENDPOINTS[name]
+                response = await _one_request(client, path, prompt)
+                result["first_request"][name] = None if response["error"] else response["latency"]
+        result["rss_after_requests_mb"] = _rss_bytes(stand_ins.app.pid) / 2**20
+    stand_ins.stop_app()
+    return result
+
+
+def _summary(runs: list):
+    summary = {
+        "startup_median": statistics.median(r["startup"] for r in runs),
+        "startup_min": min(r["startup"] for r in runs),
+        "rss_mb_median": statistics.median(r["rss_mb"] for r in runs),
+    }
+    if "first_request" in runs[0]:
+        summary["first_request_median"] = {}
+        for name in runs[0]["first_request"]:
+            latencies = [r["first_request"][name] for r in runs]
+            # None if any run failed
+            summary["first_request_median"][name] = None if None in latencies else statistics.median(latencies)
+        summary["rss_after_requests_mb_median"] = statistics.median(r["rss_after_requests_mb"] for r in runs)
+    return summary
+
+
+def _print_report(scenarios: dict):
+    print(f"{'scenario':<26} {'startup p50':>11} {'min':>7} {'RSS':>8} {'RSS after':>10}")
+    for name, scenario in scenarios.items():
+        s = scenario["summary"]
+        after = f"{s['rss_after_requests_mb_median']:.0f} MB" if "rss_after_requests_mb_median" in s else "-"
+        print(
+            f"{name:<26} {s['startup_median']:>10.2f}s {s['startup_min']:>6.2f}s "
+            f"{s['rss_mb_median']:>5.0f} MB {after:>10}"
+        )
+        for endpoint, latency in s.get("first_request_median", {}).items():
+            shown = f"{latency * 1000:.0f}ms" if latency is not None else "error"
+            print(f"    first {endpoint} request: {shown}")
+
+
+async def run(args):
+    names = args.scenarios.split(",") if args.scenarios else DEFAULT_SCENARIOS
+    envs = {name: scenario_env(name) for name in names}
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    stand_ins = StandIns(args.app_port, args.llm_port, args.site_port, extra_env)
+    scenarios = {}
+    try:
+        await stand_ins.start_backends()
+        for name, env in envs.items():
+            runs = [await run_once(stand_ins, env, args.first_requests, args.timeout) for _ in range(args.repeat)]
+            scenarios[name] = {"env": env, "runs": runs, "summary": _summary(runs)}
+    finally:
+        stand_ins.stop()
+
+    _print_report(scenarios)
+    report = {
+        "label": args.label,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "args": vars(args),
+        "scenarios": scenarios,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{stamp}-startup-{args.label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {os.path.relpath(path, ROOT)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(DEFAULT_SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="app starts per scenario")
+    parser.add_argument("--first-requests", action="store_true", help="time one request to each enabled endpoint")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--label", default="run", help="name for the results file")
+    parser.add_argument("--app-port", type=int, default=8700)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--site-port", type=int, default=8766)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the app and fake LLM")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
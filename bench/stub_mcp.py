@@ -0,0 +1,89 @@
+"""Stdio MCP servers standing in for the npx packages during benchmarks.
+
+    python bench/stub_mcp.py filesystem <root dir>   # list_directory / read_text_file, like server-filesystem
+    python bench/stub_mcp.py flight_info             # FlightInfoBot, like index.js
+
+STUB_MCP_LATENCY adds a fixed delay (seconds) to every tool call.
+"""
+import os
+import sys
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+LATENCY = float(os.getenv("STUB_MCP_LATENCY", "0"))
+
+# Same answers as index.js
+FLIGHTS = {
+    "Los Angeles": "AA1234 Departing at 9:30 AM",
+    "Chicago": "DL2478 Departing at 10:00 AM",
+    "New York": "UA5678 Departing at 11:15 AM",
+    "Miami": "SW4321 Departing at 1:45 PM",
+    "San Francisco": "BA8765 Departing at 2:30 PM",
+    "Seattle": "AS3456 Departing at 3:00 PM",
+    "Boston": "FR7890 Departing at 4:20 PM",
+    "Dallas": "VX6543 Departing at 5:10 PM",
+}
+
+
+def _delay():
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+def filesystem_server(root: str):
+    root = os.path.realpath(root)
+    server = FastMCP("Filesystem Server")
+
+    def resolve(path: str):
+        full = os.path.realpath(os.path.join(root, path))
+        if full != root and not full.startswith(root + os.sep):
+            raise ValueError(f"Access denied - path outside allowed directories: {path}")
+        return full
+
+    @server.tool()
+    def list_directory(path: str) -> str:
+        """Get a detailed listing of all files and directories in a specified path."""
+        _delay()
+        full = resolve(path)
+        return "\n".join(
+            f"[DIR] {name}" if os.path.isdir(os.path.join(full, name)) else f"[FILE] {name}"
+            for name in sorted(os.listdir(full))
+        )
+
+    @server.tool()
+    def read_text_file(path: str) -> str:
+        """Read the complete contents of a file from the file system as text."""
+        _delay()
+        full = resolve(path)
+        if os.path.isdir(full):
+            # Agents often start by reading the root; answer with the first file in it
+            files = sorted(name for name in os.listdir(full) if os.path.isfile(os.path.join(full, name)))
+            if not files:
+                return ""
+            full = os.path.join(full, files[0])
+        with open(full, encoding="utf-8") as f:
+            return f.read()
+
+    return server
+
+
+def flight_info_server():
+    server = FastMCP("Flight Info Bot")
+
+    @server.tool()
+    def FlightInfoBot(a: str) -> str:
+        """Returns flight information based on city."""
+        _delay()
+        return FLIGHTS.get(a, "No flight information available for the specified city.")
+
+    return server
+
+
+if __name__ == "__main__":
+    kind = sys.argv[1] if len(sys.argv) > 1 else "flight_info"
+    if kind == "filesystem":
+        root = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(__file__), "..", "data")
+        filesystem_server(root).run("stdio")
+    else:
+        flight_info_server().run("stdio")
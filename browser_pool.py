@@ -0,0 +1,113 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import metrics
+from app_logging import get_logger
+
+POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+CHECKOUT_TIMEOUT = float(os.getenv("BROWSER_CHECKOUT_TIMEOUT", "60"))
+HEADLESS = os.getenv("BROWSER_HEADLESS", "true").lower() in ("1", "true", "yes")
+# Same user agent MultimodalWebSurfer sets on the contexts it creates itself
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0"
+
+logger = get_logger("browser_pool")
+
+_playwright = None
+_browser = None
+_browser_lock = asyncio.Lock()
+_start_lock = asyncio.Lock()
+# One token per request that may hold a context at a time
+_slots = None
+_stats = {"checkouts": 0, "waiting": 0, "timeouts": 0, "browser_launches": 0}
+
+
+async def _ensure_browser():
+    """Return the shared Chromium, (re)launching it if it is not running."""
+    global _playwright, _browser
+    async with _browser_lock:
+        if _browser is None or not _browser.is_connected():
+            if _playwright is None:
+                # Imported here so servers that never use the web surfer don't load Playwright
+                from playwright.async_api import async_playwright
+                _playwright = await async_playwright().start()
+            with metrics.timed(metrics.BROWSER_STAGE, "browser.launch", stage="launch"):
+                _browser = await _playwright.chromium.launch(headless=HEADLESS)
+            _stats["browser_launches"] += 1
+    return _browser
+
+
+async def start():
+    """Launch the browser. Safe to call more than once."""
+    global _slots
+    async with _start_lock:
+        if _slots is not None:
+            return
+        await _ensure_browser()
+        _slots = asyncio.Queue()
+        for i in range(POOL_SIZE):
+            _slots.put_nowait(i)
+
+
+async def stop():
+    global _playwright, _browser, _slots
+    _slots = None
+    if _browser is not None:
+        await _browser.close()
+        _browser = None
+    if _playwright is not None:
+        await _playwright.stop()
+        _playwright = None
+
+
+async def _release(slots: asyncio.Queue, slot: int, context):
+    if context is not None:
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug("Closing browser context failed", extra={"slot": slot, "error": str(e)})
+    slots.put_nowait(slot)
+
+
+@asynccontextmanager
+async def checkout():
+    """Borrow a fresh browser context in the warm browser, waiting up to CHECKOUT_TIMEOUT for a free slot.
+
+    Every request gets a new context, so no cookies, storage, service workers or
+    cache carry over from the last one; the context is closed on release.
+    Yields (playwright, context) for MultimodalWebSurfer; callers must not close either.
+    """
+    await start()
+    slots = _slots
+    _stats["waiting"] += 1
+    try:
+        with metrics.timed(metrics.BROWSER_STAGE, "browser.checkout", stage="checkout"):
+            slot = await asyncio.wait_for(slots.get(), timeout=CHECKOUT_TIMEOUT)
+    except asyncio.TimeoutError:
+        _stats["timeouts"] += 1
+        raise
+    finally:
+        _stats["waiting"] -= 1
+    context = None
+    try:
+        # Relaunches the browser if it crashed
+        browser = await _ensure_browser()
+        with metrics.timed(metrics.BROWSER_STAGE, "browser.new_context", stage="new_context"):
+            context = await browser.new_context(user_agent=USER_AGENT)
+        _stats["checkouts"] += 1
+        yield _playwright, context
+    finally:
+        # Shielded so a cancelled request still closes its context and frees its slot
+        await asyncio.shield(_release(slots, slot, context))
+
+
+def pool_stats():
+    available = _slots.qsize() if _slots is not None else 0
+    return {
+        "started": _slots is not None,
+        "browser_connected": _browser is not None and _browser.is_connected(),
+        "size": POOL_SIZE,
+        "in_use": POOL_SIZE - available if _slots is not None else 0,
+        "available": available,
+        **_stats,
+    }
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "postgres")
+
+connection_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+POOL_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Optional SQL run once on every new connection, e.g. "SET search_path TO public"
+POOL_INIT_SQL = os.getenv("DB_POOL_INIT_SQL")
+# How often to check the live schema for DDL changes before reusing anything derived from it
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SQL_SCHEMA_CHECK_INTERVAL", "60"))
+
+# One hash per table or view over its column definitions; a changed hash means DDL touched it
+SCHEMA_FINGERPRINTS_QUERY = """
+    SELECT c.table_name, t.table_type,
+           md5(string_agg(c.column_name || ':' || c.data_type || ':' || c.is_nullable, ',' ORDER BY c.ordinal_position))
+               AS fingerprint
+    FROM information_schema.columns c
+    JOIN information_schema.tables t
+      ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+    WHERE c.table_schema = current_schema()
+    GROUP BY c.table_name, t.table_type
+"""
+# One hash over every table's fingerprint, so both SQL engines agree on what a schema change is
+SCHEMA_VERSION_QUERY = f"""
+    SELECT md5(coalesce(string_agg(table_name || '=' || fingerprint, ',' ORDER BY table_name), ''))
+    FROM ({SCHEMA_FINGERPRINTS_QUERY}) fingerprints
+"""
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_waiters = 0
+_schema_version = None
+_schema_checked_at = 0.0
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Per-connection setup, run by asyncpg when the pool opens a new connection."""
+    if POOL_INIT_SQL:
+        await conn.execute(POOL_INIT_SQL)
+
+
+async def init_pool():
+    """Create the app-wide connection pool. Safe to call more than once."""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                connection_string,
+                min_size=POOL_MIN_SIZE,
+                max_size=POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=POOL_MAX_INACTIVE_LIFETIME,
+                statement_cache_size=STATEMENT_CACHE_SIZE,
+                server_settings={"application_name": "agents-demo"},
+                init=_init_connection,
+            )
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+
+@asynccontextmanager
+async def acquire():
+    """Borrow a connection from the pool, creating the pool on first use."""
+    global _waiters
+    pool = _pool or await init_pool()
+    _waiters += 1
+    try:
+        conn = await pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT)
+    finally:
+        _waiters -= 1
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def schema_version():
+    """Return a hash of the current schema, re-read at most every SCHEMA_CHECK_INTERVAL seconds."""
+    global _schema_version, _schema_checked_at
+    if _schema_version is None or time.monotonic() - _schema_checked_at >= SCHEMA_CHECK_INTERVAL:
+        async with acquire() as conn:
+            _schema_version = await conn.fetchval(SCHEMA_VERSION_QUERY)
+        _schema_checked_at = time.monotonic()
+    return _schema_version
+
+
+def invalidate_schema_version():
+    """Force a schema check on the next call, e.g. after running a migration."""
+    global _schema_checked_at
+    _schema_checked_at = 0.0
+
+
+def pool_stats():
+    if _pool is None:
+        return {"initialized": False, "size": 0, "in_use": 0, "idle": 0, "waiters": _waiters}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    return {
+        "initialized": True,
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "size": size,
+        "in_use": size - idle,
+        "idle": idle,
+        "waiters": _waiters,
+    }
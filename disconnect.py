@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import os
+
+from fastapi import Request
+
+import metrics
+from app_logging import get_logger
+
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() in ("1", "true", "yes")
+# How long a disconnected request may spend cleaning up before its admission slot is given back
+CLEANUP_TIMEOUT = float(os.getenv("DISCONNECT_CLEANUP_TIMEOUT", "10"))
+# Events produced ahead of the client; small so slow clients still slow down large results
+BUFFER_EVENTS = int(os.getenv("DISCONNECT_BUFFER_EVENTS", "8"))
+
+logger = get_logger("app")
+
+_END = object()
+# Callbacks registered by the work running for the current request
+_cancel_callbacks = contextvars.ContextVar("cancel_callbacks", default=None)
+
+
+def reclaimed(kind: str):
+    """Count one piece of work (LLM stream, agent run, SQL query, browser session) stopped early."""
+    metrics.inc(metrics.RECLAIMED_WORK, kind=kind)
+
+
+def on_cancel(callback, kind: str):
+    """Call `callback` when the request's client disconnects, before its task is cancelled.
+
+    For libraries that swallow task cancellation, or wait for their background
+    work to finish when cancelled, and need to be stopped explicitly.
+    """
+    callbacks = _cancel_callbacks.get()
+    if callbacks is not None:
+        callbacks.append((callback, kind))
+
+
+async def _wait_for_disconnect(request: Request):
+    # The body has been read, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(endpoint: str, request: Request, events):
+    """Pass events through, cancelling the work producing them as soon as the client goes away.
+
+    The events are produced in their own task so that a disconnect can cancel
+    it even while it waits on an LLM, a query or a browser, not only at the
+    next write to the client.
+    """
+    if not CANCEL_ON_DISCONNECT:
+        async for event in events:
+            yield event
+        return
+
+    queue = asyncio.Queue(BUFFER_EVENTS)
+    callbacks = []
+    stopped = False
+
+    async def produce():
+        _cancel_callbacks.set(callbacks)
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            # Runs the generator's cleanup if it was suspended at a yield
+            await events.aclose()
+            if not stopped:
+                await queue.put(_END)
+
+    producer = asyncio.create_task(produce())
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+    getter = None
+    try:
+        while True:
+            if queue.empty():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    return
+                item = getter.result()
+            else:
+                item = queue.get_nowait()
+            if item is _END:
+                break
+            yield item
+        # Re-raise the producer's error so the stream ends with an error frame
+        producer.result()
+    finally:
+        watcher.cancel()
+        if getter is not None:
+            getter.cancel()
+        if not producer.done():
+            stopped = True
+            metrics.inc(metrics.CLIENT_DISCONNECTS, endpoint=endpoint)
+            logger.info("Client disconnected, cancelling request", extra={"endpoint": endpoint})
+            for callback, kind in callbacks:
+                try:
+                    callback()
+                    reclaimed(kind)
+                except Exception as e:
+                    logger.warning("Cancel callback failed", extra={"endpoint": endpoint, "error": str(e)})
+            producer.cancel()
+            try:
+                await asyncio.wait({producer}, timeout=CLEANUP_TIMEOUT)
+            except asyncio.CancelledError:
+                # The server is cancelling this response too; the producer cleans up on its own
+                pass
+            if producer.done() and not producer.cancelled():
+                # Nobody is left to report a failure during cleanup to
+                producer.exception()
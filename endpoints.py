@@ -0,0 +1,102 @@
+import asyncio
+import importlib
+import os
+import time
+
+from fastapi import HTTPException
+
+import metrics
+from app_logging import get_logger
+
+# The module behind each endpoint, imported on first use; "llm" only needs the shared OpenAI client
+ENDPOINT_MODULES = {
+    "llm": None,
+    "airline_info": "mcpfunction",
+    "flight_info": "mcpfunction_custom",
+    "sql_query": "langchainsqltest",
+    "sql_query_copilot": "asyncpgsqltest",
+    "web_surfer": "web_surfer",
+}
+
+logger = get_logger("app")
+
+
+def backend(endpoint: str):
+    """Where airline_info or flight_info answers from: "index" (in-process) or "mcp" (the MCP server pool).
+
+    Set with AIRLINE_INFO_BACKEND / FLIGHT_INFO_BACKEND.
+    """
+    return os.getenv(f"{endpoint.upper()}_BACKEND", "index")
+
+
+def _endpoint_list(env_var: str, default: str):
+    """Comma-separated endpoint names from `env_var`; "all" means every endpoint."""
+    names = [name.strip() for name in os.getenv(env_var, default).split(",") if name.strip()]
+    if names == ["all"]:
+        return list(ENDPOINT_MODULES)
+    unknown = [name for name in names if name not in ENDPOINT_MODULES]
+    if unknown:
+        raise ValueError(f"Unknown endpoints in {env_var}: {', '.join(unknown)}")
+    return names
+
+
+# Endpoints this deployment serves; the others answer 404 and their frameworks are never imported
+ENABLED_ENDPOINTS = _endpoint_list("ENABLED_ENDPOINTS", "all")
+# Endpoints loaded during startup instead of on their first request
+PREWARM_ENDPOINTS = [name for name in _endpoint_list("PREWARM_ENDPOINTS", "") if name in ENABLED_ENDPOINTS]
+
+_modules = {}
+_locks = {}
+
+
+async def _load(endpoint: str):
+    name = ENDPOINT_MODULES[endpoint]
+    if name is None:
+        return None
+    started = time.perf_counter()
+    # Importing an agent framework takes seconds of CPU; a thread keeps the event loop serving other requests
+    module = await asyncio.to_thread(importlib.import_module, name)
+    imported = time.perf_counter()
+    metrics.observe(metrics.ENDPOINT_LOAD, imported - started, endpoint=endpoint, stage="import")
+    warm_up = getattr(module, "warm_up", None)
+    if warm_up is not None:
+        try:
+            await warm_up()
+        except Exception as e:
+            # Each module retries what it needs on its first request
+            logger.warning("Endpoint warm-up failed", extra={"endpoint": endpoint, "error": str(e)})
+        metrics.observe(metrics.ENDPOINT_LOAD, time.perf_counter() - imported, endpoint=endpoint, stage="warm_up")
+    logger.info(
+        "Endpoint loaded",
+        extra={
+            "endpoint": endpoint,
+            "import_ms": round((imported - started) * 1000),
+            "warm_up_ms": round((time.perf_counter() - imported) * 1000),
+        },
+    )
+    return module
+
+
+async def load(endpoint: str):
+    """The module serving `endpoint`, imported and warmed up by the first request that needs it."""
+    if endpoint not in ENABLED_ENDPOINTS:
+        raise HTTPException(status_code=404, detail=f"The {endpoint} endpoint is not enabled on this server")
+    if endpoint not in _modules:
+        async with _locks.setdefault(endpoint, asyncio.Lock()):
+            if endpoint not in _modules:
+                _modules[endpoint] = await _load(endpoint)
+    return _modules[endpoint]
+
+
+def loaded(endpoint: str):
+    """The endpoint's module if it has been loaded, else None."""
+    return _modules.get(endpoint)
+
+
+async def prewarm():
+    for endpoint in PREWARM_ENDPOINTS:
+        await load(endpoint)
+
+
+def endpoint_stats():
+    return {"enabled": ENABLED_ENDPOINTS, "prewarm": PREWARM_ENDPOINTS, "loaded": list(_modules)}
@@ -0,0 +1,163 @@
+import asyncio
+import bisect
+import csv
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+from app_logging import get_logger
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+FLIGHT_DATA_PATH = os.getenv(
+    "FLIGHT_DATA_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "flights.csv")
+)
+# The dataset file is checked for changes at most this often (seconds)
+FLIGHT_DATA_RELOAD_INTERVAL = float(os.getenv("FLIGHT_DATA_RELOAD_INTERVAL", "5"))
+FLIGHT_MAX_RESULTS_PER_CITY = int(os.getenv("FLIGHT_MAX_RESULTS_PER_CITY", "20"))
+
+NO_FLIGHTS = "No flight information available for the specified city."
+TIME = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?\s*([ap])?\.?\s*m?\.?\s*$", re.I)
+
+logger = get_logger("flight_info")
+
+
+def parse_time(value: str):
+    """Minutes after midnight for "14:30", "2:30 PM" or "9am"."""
+    match = TIME.match(value)
+    if not match:
+        raise ValueError(f"Unrecognized time {value!r}; use HH:MM or H:MM AM/PM")
+    hours, minutes, meridiem = int(match.group(1)), int(match.group(2) or 0), (match.group(3) or "").lower()
+    if meridiem:
+        if not 1 <= hours <= 12:
+            raise ValueError(f"Unrecognized time {value!r}")
+        hours = hours % 12 + (12 if meridiem == "p" else 0)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Unrecognized time {value!r}")
+    return hours * 60 + minutes
+
+
+def format_time(minutes: int):
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours % 12 or 12}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+
+@dataclass(frozen=True)
+class Flight:
+    flight_number: str
+    city: str
+    airport: str
+    departure: int  # minutes after midnight
+
+
+class FlightTable:
+    """An immutable snapshot of the dataset with hash indexes on city and airport.
+
+    Each index entry is sorted by departure time, so time ranges are two bisects.
+    """
+
+    def __init__(self, flights: list):
+        self.count = len(flights)
+        self.by_place = {}
+        for flight in sorted(flights, key=lambda f: f.departure):
+            self.by_place.setdefault(flight.city.lower(), []).append(flight)
+            self.by_place.setdefault(flight.airport.lower(), []).append(flight)
+        self.departures = {place: [f.departure for f in flights] for place, flights in self.by_place.items()}
+
+    def lookup(self, place: str, after: int = None, before: int = None):
+        key = place.strip().lower()
+        flights = self.by_place.get(key, [])
+        departures = self.departures.get(key, [])
+        start = bisect.bisect_left(departures, after) if after is not None else 0
+        end = bisect.bisect_right(departures, before) if before is not None else len(flights)
+        return flights[start:end]
+
+
+def _read_rows(path: str):
+    if path.endswith(".parquet"):
+        if parquet is None:
+            raise RuntimeError("Reading Parquet flight data needs pyarrow installed")
+        return parquet.read_table(path).to_pylist()
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def load_table(path: str = FLIGHT_DATA_PATH):
+    flights = [
+        Flight(row["flight_number"], row["city"], row["airport"], parse_time(str(row["departure_time"])))
+        for row in _read_rows(path)
+    ]
+    return FlightTable(flights)
+
+
+class _Dataset:
+    """The current FlightTable, swapped for a new one when the file changes."""
+
+    def __init__(self, path: str = FLIGHT_DATA_PATH):
+        self.path = path
+        self.table = None
+        self.signature = None
+        self.checked_at = 0.0
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Reload the dataset if its file changed. Blocking; a bad file keeps the previous table."""
+        if not force and self.table is not None and time.monotonic() - self.checked_at < FLIGHT_DATA_RELOAD_INTERVAL:
+            return
+        with self.lock:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature != self.signature:
+                try:
+                    self.table = load_table(self.path)
+                    self.signature = signature
+                    self.reloads += 1
+                    logger.info("Flight data loaded", extra={"path": self.path, "flights": self.table.count})
+                except (OSError, KeyError, ValueError, RuntimeError) as e:
+                    if self.table is None:
+                        raise
+                    logger.warning("Flight data reload failed, keeping the previous data", extra={"error": str(e)})
+            self.checked_at = time.monotonic()
+
+
+_dataset = _Dataset()
+
+
+async def load():
+    """Load the dataset up front so the first request doesn't pay for it."""
+    await asyncio.to_thread(_dataset.refresh, True)
+
+
+async def find_flights(places: list, departs_after: str = None, departs_before: str = None):
+    """Flights from each city or airport code, optionally within a departure time window: {place: [Flight]}."""
+    await asyncio.to_thread(_dataset.refresh)
+    after = parse_time(departs_after) if departs_after else None
+    before = parse_time(departs_before) if departs_before else None
+    table = _dataset.table
+    return {place: table.lookup(place, after, before)[:FLIGHT_MAX_RESULTS_PER_CITY] for place in places}
+
+
+def format_results(results: dict, windowed: bool = False):
+    lines = []
+    for place, flights in results.items():
+        if not flights:
+            lines.append(f"{place}: {'No flights departing in that time window.' if windowed else NO_FLIGHTS}")
+        for flight in flights:
+            lines.append(f"{flight.city} ({flight.airport}): {flight.flight_number} Departing at {format_time(flight.departure)}")
+    return "\n".join(lines)
+
+
+def index_stats():
+    table = _dataset.table
+    return {
+        "path": _dataset.path,
+        "flights": table.count if table else 0,
+        "places": len(table.by_place) if table else 0,
+        "reloads": _dataset.reloads,
+    }
@@ -1,4 +1,9 @@
+import asyncio
+import contextvars
+import functools
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 from langchain_community.chat_models import ChatOpenAI
@@ -6,47 +11,300 @@ from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits.sql.base import create_sql_agent
 #from langchain.agents.agent_types import AgentType
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import (
+    InfoSQLDatabaseTool,
+    ListSQLDatabaseTool,
+    QuerySQLDatabaseTool,
+)
+from sqlalchemy import MetaData, create_engine, event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import disconnect
+import metrics
+import sql_guardrails
+import sse
+from db_pool import SCHEMA_CHECK_INTERVAL, SCHEMA_FINGERPRINTS_QUERY, connection_string
 
 load_dotenv()  # Load environment variables from .env file
 
-DB_USER = "postgres"
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "postgres"
+# SQLDatabase only speaks to a synchronous engine, so every blocking database
+# call is run on this dedicated, bounded pool instead of the event loop
+SQL_OFFLOAD_MAX_WORKERS = int(os.getenv("SQL_OFFLOAD_MAX_WORKERS", "4"))
+_sql_executor = ThreadPoolExecutor(max_workers=SQL_OFFLOAD_MAX_WORKERS, thread_name_prefix="sql")
 
-connection_string = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-def setup_database():
-    """Set up sample database talbes and data if they do not exist."""
-    db = SQLDatabase.from_uri(connection_string)
-    return db
+async def run_in_sql_executor(func, *args, **kwargs):
+    """Run a blocking database call on the bounded SQL executor."""
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sql_executor, functools.partial(ctx.run, func, *args, **kwargs))
 
 
-def advanced_sql_agent(db: SQLDatabase):
-    """Create a more advanced Langchain SQL agent."""
-    llm = ChatOpenAI(
+class _RunningQuery:
+    """The DBAPI connection a tool call is running a query on, so the query can be cancelled from the event loop."""
+
+    def __init__(self):
+        self.connection = None
+
+    def cancel(self):
+        connection = self.connection
+        if connection is not None:
+            # psycopg2 sends the cancel request on a separate connection; safe from another thread
+            connection.cancel()
+
+
+# Set by the tool call and copied into the executor thread with the rest of its context
+_running_query = contextvars.ContextVar("running_query", default=None)
+
+
+def _track_running_query(conn, cursor, statement, parameters, context, executemany):
+    running = _running_query.get()
+    if running is not None:
+        running.connection = cursor.connection
+
+
+def _untrack_running_query(conn, cursor, statement, parameters, context, executemany):
+    running = _running_query.get()
+    if running is not None:
+        running.connection = None
+
+
+# The reviewed query a sql_db_query call is about to run, whose transaction gets the guardrail settings
+_guarded_query = contextvars.ContextVar("guarded_query", default=None)
+
+
+def _apply_guardrails(conn):
+    query = _guarded_query.get()
+    if query is not None:
+        conn.exec_driver_sql(sql_guardrails.transaction_settings(query))
+
+
+class _OffloadedSQLTool:
+    """Async path for the SQL tools that uses the bounded SQL executor."""
+
+    async def _arun(self, *args, run_manager=None, **kwargs):
+        if run_manager is not None:
+            kwargs["run_manager"] = run_manager.get_sync()
+        running = _RunningQuery()
+        token = _running_query.set(running)
+        try:
+            with metrics.timed(metrics.SQL_STAGE, f"sql.{self.name}", engine="sqlalchemy", stage=self.name):
+                return await run_in_sql_executor(self._run, *args, **kwargs)
+        except asyncio.CancelledError:
+            # The executor thread can't be interrupted, but its query can
+            running.cancel()
+            disconnect.reclaimed("sql_query")
+            raise
+        finally:
+            _running_query.reset(token)
+
+
+class OffloadedQuerySQLDatabaseTool(_OffloadedSQLTool, QuerySQLDatabaseTool):
+    def _run(self, query: str, run_manager=None):
+        """Run the query under the SQL guardrails; a rejection goes back to the agent as an error to fix."""
+        if not sql_guardrails.SQL_GUARD_ENABLED:
+            return super()._run(query, run_manager)
+        try:
+            guarded = sql_guardrails.review(query)
+            # The EXPLAIN and the query itself go through psycopg2's simple query protocol
+            sql_guardrails.check_single_statement_text(guarded)
+            with self.db._engine.connect() as conn:
+                with metrics.timed(metrics.SQL_STAGE, "sql.explain", engine="sqlalchemy", stage="explain"):
+                    plan = conn.exec_driver_sql(sql_guardrails.explain_sql(guarded)).scalar()
+            sql_guardrails.check_plan(guarded, plan)
+        except sql_guardrails.QueryRejected as e:
+            sql_guardrails.rejected("sqlalchemy", query, e)
+            return f"Error: {e}"
+        except SQLAlchemyError as e:
+            return f"Error: {e}"
+        sql_guardrails.passed("sqlalchemy", guarded)
+        token = _guarded_query.set(guarded)
+        try:
+            return super()._run(guarded.sql, run_manager)
+        finally:
+            _guarded_query.reset(token)
+
+
+class OffloadedInfoSQLDatabaseTool(_OffloadedSQLTool, InfoSQLDatabaseTool):
+    pass
+
+
+class OffloadedListSQLDatabaseTool(_OffloadedSQLTool, ListSQLDatabaseTool):
+    pass
+
+
+_OFFLOADED_TOOLS = {
+    QuerySQLDatabaseTool: OffloadedQuerySQLDatabaseTool,
+    InfoSQLDatabaseTool: OffloadedInfoSQLDatabaseTool,
+    ListSQLDatabaseTool: OffloadedListSQLDatabaseTool,
+}
+
+
+class OffloadedSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """SQLDatabaseToolkit whose database tools never block the event loop."""
+
+    def get_tools(self):
+        tools = []
+        for tool in super().get_tools():
+            offloaded = _OFFLOADED_TOOLS.get(type(tool))
+            tools.append(offloaded(db=tool.db, description=tool.description) if offloaded else tool)
+        return tools
+
+
+def create_llm():
+    return ChatOpenAI(
         temperature=0,
+        streaming=True,
         api_key=os.getenv("API_KEY"),
         base_url=os.getenv("BASE_URL"),
         model=os.getenv("LLM_MODEL"),
     )
 
+
+def advanced_sql_agent(db: SQLDatabase, llm):
+    """Create a more advanced Langchain SQL agent."""
     agent = create_sql_agent(
         llm=llm,
-        db=db,
-        verbose=True,
+        toolkit=OffloadedSQLDatabaseToolkit(db=db, llm=llm),
+        verbose=False,
         agent_type='openai-tools',
         handle_parsing_errors=True
     )
     return agent
 
+
+class _SQLAgentCache:
+    """The engine, reflected schema and agent executor shared by all requests."""
+
+    def __init__(self):
+        self.engine = None
+        self.llm = None
+        self.metadata = MetaData()
+        self.fingerprints = {}
+        self.table_info = {}
+        self.db = None
+        self.agent = None
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self):
+        return self.agent is not None and time.monotonic() - self.checked_at < SCHEMA_CHECK_INTERVAL
+
+    def refresh(self):
+        """Re-reflect only the tables whose definition changed. Blocking; run it off the event loop."""
+        if self.engine is None:
+            self.engine = create_engine(connection_string, pool_pre_ping=True)
+            event.listen(self.engine, "before_cursor_execute", _track_running_query)
+            event.listen(self.engine, "after_cursor_execute", _untrack_running_query)
+            event.listen(self.engine, "begin", _apply_guardrails)
+            self.llm = create_llm()
+        with self.engine.connect() as conn:
+            # Only base tables are reflected
+            fingerprints = {
+                name: fingerprint
+                for name, table_type, fingerprint in conn.execute(text(SCHEMA_FINGERPRINTS_QUERY))
+                if table_type == "BASE TABLE"
+            }
+        changed = [name for name, fingerprint in fingerprints.items() if self.fingerprints.get(name) != fingerprint]
+        dropped = [name for name in self.fingerprints if name not in fingerprints]
+        if self.agent is None or changed or dropped:
+            # Build a new MetaData generation so requests still using the old
+            # SQLDatabase never see tables disappear underneath them
+            metadata = MetaData()
+            for name, table in self.metadata.tables.items():
+                if name in fingerprints and name not in changed:
+                    table.to_metadata(metadata)
+            if changed:
+                metadata.reflect(bind=self.engine, only=changed)
+            table_info = {name: info for name, info in self.table_info.items() if name in fingerprints and name not in changed}
+            probe = SQLDatabase(self.engine, metadata=metadata, lazy_table_reflection=True)
+            for name in changed:
+                table_info[name] = probe.get_table_info([name])
+
+            self.db = SQLDatabase(
+                self.engine,
+                metadata=metadata,
+                lazy_table_reflection=True,
+                custom_table_info=table_info,
+            )
+            self.agent = advanced_sql_agent(self.db, self.llm)
+            self.metadata = metadata
+            self.table_info = table_info
+            self.fingerprints = fingerprints
+        self.checked_at = time.monotonic()
+
+
+_cache = _SQLAgentCache()
+
+
+async def get_sql_agent():
+    """Return the shared agent, refreshing the schema when the check interval has passed."""
+    if _cache.is_fresh():
+        return _cache.agent
+    if _cache.agent is not None and _cache.lock.locked():
+        # Another request is already checking the schema; keep serving the current agent
+        return _cache.agent
+    async with _cache.lock:
+        if not _cache.is_fresh():
+            await run_in_sql_executor(_cache.refresh)
+    return _cache.agent
+
+
+def invalidate_schema():
+    """Force a schema check on the next request, e.g. after running a migration."""
+    _cache.checked_at = 0.0
+
+
+def _tool_result_cacheable(name: str, tool_input, output):
+    """Whether an answer built on this tool call may be cached: not after errors or data modifications."""
+    if str(getattr(output, "content", output)).startswith("Error"):
+        return False
+    if name == "sql_db_query":
+        query = tool_input.get("query", "") if isinstance(tool_input, dict) else str(tool_input or "")
+        try:
+            return not sql_guardrails.review(query).modifies
+        except sql_guardrails.QueryRejected:
+            return False
+    return True
+
 async def rag_query(user_input):
-    db = setup_database()
-    agent = advanced_sql_agent(db)
-    result = await agent.arun(user_input)
-    return result
+    agent = await get_sql_agent()
+    # Tool inputs by run id, kept until the tool ends
+    active_tool_runs = {}
+    # ChatOpenAI has its own HTTP client, so its calls are timed from the events
+    llm_started = {}
+    model = os.getenv("LLM_MODEL")
+    async for event in agent.astream_events({"input": user_input}, version="v2"):
+        kind = event["event"]
+        if kind == "on_chat_model_start":
+            llm_started[event["run_id"]] = time.perf_counter()
+        elif kind == "on_chat_model_end":
+            started = llm_started.pop(event["run_id"], None)
+            if started is not None:
+                metrics.observe(metrics.LLM_CALL, time.perf_counter() - started, profile="default", model=model, operation="completions")
+            usage = getattr(event["data"].get("output"), "usage_metadata", None)
+            if usage:
+                metrics.record_tokens("default", model, usage.get("input_tokens"), usage.get("output_tokens"))
+        elif kind == "on_tool_start":
+            active_tool_runs[event["run_id"]] = event["data"].get("input")
+            yield sse.tool_call(event["name"], event["data"].get("input"))
+        elif kind == "on_tool_end":
+            tool_input = active_tool_runs.pop(event["run_id"], None)
+            output = event["data"].get("output")
+            if not _tool_result_cacheable(event["name"], tool_input, output):
+                # The statement must run again next time, and an error may not recur
+                yield sse.no_store()
+            yield sse.tool_result(event["name"], output)
+        elif kind == "on_chat_model_stream" and not active_tool_runs.keys() & set(event.get("parent_ids", ())):
+            # Skip tokens from LLM calls made inside a tool, e.g. the query checker
+            content = event["data"]["chunk"].content
+            if content:
+                yield sse.token(content)
 
 async def run_sql_query(message: str):
-    result = await rag_query(message)
-    return result
\ No newline at end of file
+    async for event in rag_query(message):
+        yield event
+
+async def warm_up():
+    """Connect and build the agent before the first request."""
+    await get_sql_agent()
@@ -0,0 +1,84 @@
+import os
+
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# Env profile name -> suffix of the API_KEY/BASE_URL/LLM_MODEL variables it reads
+PROFILES = {
+    "default": "",
+    "LOCAL": "_LOCAL",
+    "EXTERNAL": "_EXTERNAL",
+}
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "120"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("LLM_HTTP_READ_TIMEOUT", "600"))
+HTTP2_ENABLED = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+_http_clients = {}
+_clients = {}
+
+
+def _env(name: str, profile: str):
+    if profile not in PROFILES:
+        raise KeyError(f"Unknown LLM profile: {profile}")
+    return os.getenv(f"{name}{PROFILES[profile]}")
+
+
+def get_model_name(profile: str = "default"):
+    return _env("LLM_MODEL", profile)
+
+
+def get_http_client(profile: str = "default"):
+    """Return the long-lived httpx client (connection pool + TLS sessions) for a profile."""
+    http_client = _http_clients.get(profile)
+    if http_client is None:
+        _env("BASE_URL", profile)  # validate the profile name
+        transport = httpx.AsyncHTTPTransport(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        http_client = httpx.AsyncClient(
+            transport=metrics.instrument_transport(transport, profile, get_model_name(profile)),
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        _http_clients[profile] = http_client
+    return http_client
+
+
+def get_client(profile: str = "default"):
+    """Return the shared AsyncOpenAI client for a profile, creating it on first use."""
+    client = _clients.get(profile)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=_env("API_KEY", profile),
+            base_url=_env("BASE_URL", profile),
+            http_client=get_http_client(profile),
+        )
+        _clients[profile] = client
+    return client
+
+
+def init_clients():
+    """Build a client for every profile that is configured in the environment."""
+    for profile in PROFILES:
+        if _env("API_KEY", profile):
+            get_client(profile)
+
+
+async def close_clients():
+    _clients.clear()
+    while _http_clients:
+        _, http_client = _http_clients.popitem()
+        await http_client.aclose()
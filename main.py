@@ -1,24 +1,49 @@
-import os
-from openai import AsyncOpenAI
+import asyncio
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from asyncpgsqltest import run_sql_query_copilot
-from langchainsqltest import run_sql_query
-from mcpfunction import run_mcp
-from mcpfunction_custom import run_mcp_custom
-from web_surfer import run_web_surfer
+import admission
+import app_logging
+import browser_pool
+import db_pool
+import disconnect
+import endpoints
+import flight_index
+import llm_clients
+import mcp_pool
+import metrics
+import policy_index
+import response_cache
+import screenshot_store
+import sql_guardrails
+import sse
 
 from pydantic import BaseModel
 
+app_logging.setup_logging()
+logger = app_logging.get_logger("app")
+
 class RequestJSONdata(BaseModel):
     userRequestText: str
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    llm_clients.init_clients()
+    # Each endpoint's framework is imported, and its pools started, by its first
+    # request unless it is listed in PREWARM_ENDPOINTS
+    await endpoints.prewarm()
+    yield
+    await browser_pool.stop()
+    await mcp_pool.stop()
+    await db_pool.close_pool()
+    await llm_clients.close_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 favicon_path = 'favicon.ico'
 
@@ -32,6 +57,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
+)
+# Mounted before /static so screenshots get long-lived cache headers
+app.mount(
+    screenshot_store.SCREENSHOT_URL_PATH,
+    screenshot_store.ImmutableStaticFiles(directory=screenshot_store.SCREENSHOT_DIR, check_dir=False),
+    name="screenshots",
 )
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -41,103 +73,137 @@ async def favicon():
     return FileResponse(favicon_path)
 
 
-@app.post("/processLLMfetchRequest")
-async def processLLMfetchRequest(requestJSONdata: RequestJSONdata):
-    client = AsyncOpenAI(
-        api_key=os.getenv("API_KEY_LOCAL"),
-        base_url=os.getenv("BASE_URL_LOCAL")
-    )
-    stream = await client.chat.completions.create(
-    messages=[
-        {
-            "role": "user",
-            "content": requestJSONdata.userRequestText
-        }
-    ],
-    model = os.getenv("LLM_MODEL_LOCAL"),
-    stream=True,
-    max_tokens=500,
+@app.get("/poolStats")
+async def poolStats():
+    return {"db": db_pool.pool_stats(), "mcp": mcp_pool.pool_stats(), "browser": browser_pool.pool_stats()}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metricsEndpoint():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/admissionStats")
+async def admissionStats():
+    return {**admission.admission_stats(), "sql_guardrails": sql_guardrails.guardrail_stats()}
+
+
+@app.get("/endpointStats")
+async def endpointStats():
+    return endpoints.endpoint_stats()
+
+
+@app.get("/cacheStats")
+async def cacheStats():
+    copilot = endpoints.loaded("sql_query_copilot")
+    return {
+        **response_cache.cache_stats(),
+        "copilot": copilot.copilot_cache_stats() if copilot else None,
+        "screenshots": screenshot_store.store_stats(),
+        "policy_index": policy_index.index_stats(),
+        "flight_index": flight_index.index_stats(),
+    }
+
+
+def streaming_response(endpoint: str, request: Request, events, headers=None, ticket=None):
+    """Stream StreamEvents as SSE, recording time-to-first-token and total duration for the endpoint.
+
+    The work behind the stream is cancelled if the client disconnects.
+    `ticket` is the request's admission slot, held until the stream is done.
+    """
+    events = disconnect.cancel_on_disconnect(endpoint, request, metrics.instrument_stream(endpoint, events))
+    if ticket is None:
+        return StreamingResponse(sse.sse_stream(events), media_type="text/event-stream", headers=headers)
+    return admission.AdmittedStreamingResponse(
+        ticket, sse.sse_stream(events), media_type="text/event-stream", headers=headers
     )
 
+
+async def cached_streaming_response(endpoint: str, request: Request, message: str, run):
+    """Replay a cached answer, or stream `run(message)` and cache its answer when it completes."""
+    admission.rate_limit(endpoint, request)
+    cache_lookup = await response_cache.lookup(endpoint, message, llm_clients.get_model_name())
+    if cache_lookup.answer is not None:
+        # Replays are cheap and don't take an endpoint slot
+        events = response_cache.replay(cache_lookup.answer, cache_lookup.truncated)
+        return streaming_response(endpoint, request, events, {"X-Cache": f"HIT-{cache_lookup.tier.upper()}"})
+    ticket = await admission.acquire(endpoint)
+    events = response_cache.record(cache_lookup, run(message))
+    return streaming_response(endpoint, request, events, {"X-Cache": "MISS"}, ticket)
+
+
+@app.post("/processLLMfetchRequest")
+async def processLLMfetchRequest(requestJSONdata: RequestJSONdata, request: Request):
+    await endpoints.load("llm")
+    client = llm_clients.get_client("LOCAL")
+    model = llm_clients.get_model_name("LOCAL")
+    ticket = await admission.admit("llm", request)
+    try:
+        stream = await client.chat.completions.create(
+        messages=[
+            {
+                "role": "user",
+                "content": requestJSONdata.userRequestText
+            }
+        ],
+        model = model,
+        stream=True,
+        max_tokens=500,
+        )
+    except Exception:
+        ticket.release()
+        raise
+
     async def generator():
-        async for chunk in stream:
-            if chunk.choices:
-                yield chunk.choices[0].delta.content or ""
-    
-    response_messages = generator()
-    return StreamingResponse(response_messages, media_type="text/event-stream")
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield sse.token(chunk.choices[0].delta.content)
+                if chunk.usage:
+                    # Only sent by servers that report usage on streams
+                    metrics.record_tokens("LOCAL", model, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+        except (asyncio.CancelledError, GeneratorExit):
+            disconnect.reclaimed("llm_stream")
+            raise
+        finally:
+            # Closing the response stops the server generating the rest of the tokens
+            await stream.close()
+
+    return streaming_response("llm", request, generator(), ticket=ticket)
 
 
 @app.post("/processLLMfetchRequestForAirlineInfo/")
-async def processLLMfetchRequestForAirlineInfo(requestJSONdata: RequestJSONdata):
-    async def stream_mcp_response():
-        response = await run_mcp(requestJSONdata.userRequestText)
-        # If response is a string, yield it in chunks or all at once
-        if isinstance(response, str):
-            yield response
-        else:
-            # If response is already an async generator, iterate through it
-            async for chunk in response:
-                yield chunk
-
-    return StreamingResponse(stream_mcp_response(), media_type="text/event-stream")
+async def processLLMfetchRequestForAirlineInfo(requestJSONdata: RequestJSONdata, request: Request):
+    airline_info = await endpoints.load("airline_info")
+    return await cached_streaming_response(
+        "airline_info", request, requestJSONdata.userRequestText, airline_info.run_airline_info
+    )
 
 
 @app.post("/processLLMfetchRequestForFlightInfo/")
-async def processLLMfetchRequestForFlightInfo(requestJSONdata: RequestJSONdata):
-    async def stream_mcp_response():
-        response = await run_mcp_custom(requestJSONdata.userRequestText)
-        # If response is a string, yield it in chunks or all at once
-        if isinstance(response, str):
-            yield response
-        else:
-            # If response is already an async generator, iterate through it
-            async for chunk in response:
-                yield chunk
-
-    return StreamingResponse(stream_mcp_response(), media_type="text/event-stream")
+async def processLLMfetchRequestForFlightInfo(requestJSONdata: RequestJSONdata, request: Request):
+    flight_info = await endpoints.load("flight_info")
+    ticket = await admission.admit("flight_info", request)
+    events = flight_info.run_flight_info(requestJSONdata.userRequestText)
+    return streaming_response("flight_info", request, events, ticket=ticket)
 
 
 @app.post("/processLLMfetchRequestForSQLquery/")
-async def processLLMfetchRequestForSQLquery(requestJSONdata: RequestJSONdata):
-    async def stream_sql_response():
-        response = await run_sql_query(requestJSONdata.userRequestText)
-        # If response is a string, yield it in chunks or all at once
-        if isinstance(response, str):
-            yield response
-        else:
-            # If response is already an async generator, iterate through it
-            async for chunk in response:
-                yield chunk
-
-    return StreamingResponse(stream_sql_response(), media_type="text/event-stream")
+async def processLLMfetchRequestForSQLquery(requestJSONdata: RequestJSONdata, request: Request):
+    sql_query = await endpoints.load("sql_query")
+    return await cached_streaming_response("sql_query", request, requestJSONdata.userRequestText, sql_query.run_sql_query)
 
 
 @app.post("/processLLMfetchRequestForSQLqueryCopilot/")
-async def processLLMfetchRequestForSQLqueryCopilot(requestJSONdata: RequestJSONdata):
-    async def stream_sql_response():
-        response = await run_sql_query_copilot(requestJSONdata.userRequestText)
-        # If response is a string, yield it in chunks or all at once
-        if isinstance(response, str):
-            yield response
-        else:
-            # If response is already an async generator, iterate through it
-            async for chunk in response:
-                yield chunk
-
-    return StreamingResponse(stream_sql_response(), media_type="text/event-stream")
+async def processLLMfetchRequestForSQLqueryCopilot(requestJSONdata: RequestJSONdata, request: Request):
+    copilot = await endpoints.load("sql_query_copilot")
+    return await cached_streaming_response(
+        "sql_query_copilot", request, requestJSONdata.userRequestText, copilot.run_sql_query_copilot
+    )
 
 @app.post("/processLLMfetchRequestForWebSurfer/")
-async def processLLMfetchRequestForWebSurfer(requestJSONdata: RequestJSONdata):
-    async def stream_websurfer_response():
-        response = await run_web_surfer(requestJSONdata.userRequestText)
-        for chunk in response:
-            if isinstance(chunk, str):
-                yield chunk
-            elif isinstance(chunk, list):
-                # Handle list items (e.g., [text, image_object])
-                for item in chunk:
-                    if isinstance(item, str):
-                        yield item
-
-    return StreamingResponse(stream_websurfer_response(), media_type="text/event-stream")
+async def processLLMfetchRequestForWebSurfer(requestJSONdata: RequestJSONdata, request: Request):
+    web_surfer = await endpoints.load("web_surfer")
+    ticket = await admission.admit("web_surfer", request)
+    return streaming_response("web_surfer", request, web_surfer.run_web_surfer(requestJSONdata.userRequestText), ticket=ticket)
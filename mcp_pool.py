@@ -0,0 +1,228 @@
+import asyncio
+import os
+import shlex
+import shutil
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import metrics
+from app_logging import get_logger
+
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+SESSION_MAX_CONCURRENCY = int(os.getenv("MCP_SESSION_MAX_CONCURRENCY", "4"))
+CHECKOUT_TIMEOUT = float(os.getenv("MCP_CHECKOUT_TIMEOUT", "30"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT", "5"))
+CLIENT_SESSION_TIMEOUT = float(os.getenv("MCP_CLIENT_SESSION_TIMEOUT", "30"))
+MAX_RESTART_BACKOFF = 30.0
+
+logger = get_logger("mcp_pool")
+
+
+@dataclass(frozen=True)
+class MCPServerSpec:
+    """How to launch one kind of stdio MCP server."""
+    name: str
+    command: str
+    args: tuple = ()
+    env: dict = field(default=None, hash=False, compare=False)
+
+
+def spec_from_env(name: str, env_var: str, command: str, args: list):
+    """Build a spec, letting `env_var` override the whole command line."""
+    override = os.getenv(env_var)
+    if override:
+        command, *args = shlex.split(override)
+    if not shutil.which(command):
+        raise RuntimeError(f"{command} is not installed or not found in PATH (override with {env_var}).")
+    return MCPServerSpec(name=name, command=command, args=tuple(args))
+
+
+@lru_cache(maxsize=1)
+def _timed_server_class():
+    """MCPServerStdio that records tool-call latency and reports a lost connection to its pooled session.
+
+    Defined on first use so that importing the pool doesn't load the Agents SDK.
+    """
+    from agents.mcp import MCPServerStdio
+    from anyio import BrokenResourceError, ClosedResourceError, EndOfStream
+    from mcp.shared.exceptions import McpError
+    from mcp.types import CONNECTION_CLOSED
+
+    class _TimedMCPServerStdio(MCPServerStdio):
+        # Called with the error when a tool call finds the subprocess gone
+        on_connection_lost = None
+
+        async def call_tool(self, tool_name, arguments):
+            try:
+                with metrics.timed(metrics.MCP_TOOL_CALL, "mcp.call_tool", server=self.name, tool=tool_name):
+                    return await super().call_tool(tool_name, arguments)
+            except (BrokenResourceError, ClosedResourceError, EndOfStream, McpError) as e:
+                lost = not isinstance(e, McpError) or e.error.code == CONNECTION_CLOSED
+                if lost and self.on_connection_lost is not None:
+                    self.on_connection_lost(self, e)
+                raise
+
+    return _TimedMCPServerStdio
+
+
+class _PooledSession:
+    """One long-lived MCP server subprocess, restarted by its supervisor task when it dies."""
+
+    def __init__(self, spec: MCPServerSpec, index: int):
+        self.spec = spec
+        self.index = index
+        self.server = None
+        self.ready = asyncio.Event()
+        self.slots = asyncio.Semaphore(SESSION_MAX_CONCURRENCY)
+        self.in_flight = 0
+        self.restarts = 0
+        self._restart = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        # The server is entered and exited inside this one task: the MCP stdio
+        # transport uses anyio cancel scopes that must not cross tasks.
+        self._task = asyncio.create_task(self._supervise(), name=f"mcp:{self.spec.name}:{self.index}")
+
+    async def stop(self):
+        self._stopping = True
+        self._restart.set()
+        if self._task is None:
+            return
+        if not self.ready.is_set():
+            # Still connecting or backing off after a crash: nothing to drain
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def restart(self):
+        self._restart.set()
+
+    def connection_lost(self, server, error: Exception):
+        """Stop handing out a server whose subprocess died, instead of waiting for the next health check."""
+        if server is self.server and self.ready.is_set():
+            logger.warning(
+                "MCP server connection lost", extra={"server": self.spec.name, "index": self.index, "error": str(error)}
+            )
+            self.ready.clear()
+            self.restart()
+
+    async def _supervise(self):
+        backoff = 1.0
+        while not self._stopping:
+            params = {"command": self.spec.command, "args": list(self.spec.args)}
+            if self.spec.env:
+                params["env"] = self.spec.env
+            server = _timed_server_class()(
+                name=self.spec.name,
+                params=params,
+                cache_tools_list=True,
+                client_session_timeout_seconds=CLIENT_SESSION_TIMEOUT,
+            )
+            server.on_connection_lost = self.connection_lost
+            try:
+                with metrics.timed(metrics.MCP_SPAWN, "mcp.spawn", server=self.spec.name):
+                    await server.connect()
+                    # Fill the tools cache once so agent runs never re-list tools
+                    await server.list_tools()
+                self.server = server
+                self.ready.set()
+                backoff = 1.0
+                await self._restart.wait()
+            except Exception as e:
+                logger.warning("MCP server failed", extra={"server": self.spec.name, "index": self.index, "error": str(e)})
+            finally:
+                self.ready.clear()
+                self.server = None
+                self._restart.clear()
+                # Also runs when stop() cancels a connect in progress, which
+                # `async with server` would skip and leak the subprocess
+                await server.cleanup()
+            if not self._stopping:
+                self.restarts += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_RESTART_BACKOFF)
+
+    async def check_health(self):
+        server = self.server
+        if server is None or server.session is None:
+            return
+        try:
+            await asyncio.wait_for(server.session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT)
+        except Exception as e:
+            logger.warning(
+                "MCP server failed health check", extra={"server": self.spec.name, "index": self.index, "error": str(e)}
+            )
+            self.restart()
+
+
+_sessions = {}
+_health_task = None
+
+
+def start(spec: MCPServerSpec):
+    """Launch the warm sessions for a server spec if they are not running yet."""
+    global _health_task
+    if spec not in _sessions:
+        sessions = [_PooledSession(spec, i) for i in range(POOL_SIZE)]
+        for pooled in sessions:
+            pooled.start()
+        _sessions[spec] = sessions
+    if _health_task is None:
+        _health_task = asyncio.create_task(_health_check_loop(), name="mcp:health")
+
+
+async def stop():
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+        _health_task = None
+    while _sessions:
+        _, sessions = _sessions.popitem()
+        await asyncio.gather(*(pooled.stop() for pooled in sessions))
+
+
+async def _health_check_loop():
+    while True:
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        for sessions in list(_sessions.values()):
+            await asyncio.gather(*(pooled.check_health() for pooled in sessions))
+
+
+@asynccontextmanager
+async def session(spec: MCPServerSpec):
+    """Check out the least busy warm server for `spec`, waiting for a free slot."""
+    start(spec)
+    sessions = _sessions[spec]
+    candidates = [pooled for pooled in sessions if pooled.ready.is_set()] or sessions
+    pooled = min(candidates, key=lambda p: p.in_flight)
+    pooled.in_flight += 1
+    try:
+        async with pooled.slots:
+            await asyncio.wait_for(pooled.ready.wait(), timeout=CHECKOUT_TIMEOUT)
+            yield pooled.server
+    finally:
+        pooled.in_flight -= 1
+
+
+def pool_stats():
+    return {
+        spec.name: [
+            {
+                "ready": pooled.ready.is_set(),
+                "in_flight": pooled.in_flight,
+                "restarts": pooled.restarts,
+            }
+            for pooled in sessions
+        ]
+        for spec, sessions in _sessions.items()
+    }
@@ -1,56 +1,124 @@
+import asyncio
 import os
 import shutil
+from functools import lru_cache
 
-from agents import Agent, Runner, set_default_openai_api, set_default_openai_client, set_tracing_disabled
-from agents.mcp import MCPServer, MCPServerStdio
-from openai import AsyncOpenAI
+from agents import Agent, OpenAIChatCompletionsModel, Runner, function_tool, set_tracing_disabled
+from agents.mcp import MCPServer
 from dotenv import load_dotenv
+from openai.types.responses import ResponseTextDeltaEvent
+
+import disconnect
+import endpoints
+import mcp_pool
+import metrics
+import policy_index
+import sse
+from app_logging import digest, get_logger, truncate
+from llm_clients import get_client, get_model_name
 
 load_dotenv()
+set_tracing_disabled(disabled=True)
+logger = get_logger("airline_info")
+
+# "index" answers from the in-process policy index in one tool call; "mcp" uses the filesystem MCP server
+AIRLINE_INFO_BACKEND = endpoints.backend("airline_info")
+
+@function_tool
+async def search_airline_policies(query: str) -> str:
+    """Search the airline policy documents and return the most relevant sections.
+
+    Args:
+        query: What the customer wants to know, e.g. "carry-on size limits".
+    """
+    hits = await policy_index.search(query)
+    logger.info("Policy search", extra={"query": truncate(query), "hits": len(hits)})
+    return policy_index.format_hits(hits)
 
 async def run(mcp_server: MCPServer, message: str):
-    client = AsyncOpenAI(
-        api_key = os.getenv("API_KEY"),
-        base_url = os.getenv("BASE_URL")
-    )
-    set_default_openai_client(client=client, use_for_tracing=False)
-    set_default_openai_api("chat_completions")
-    set_tracing_disabled(disabled=True)
-    model_name = os.getenv("LLM_MODEL")
+    model = OpenAIChatCompletionsModel(model=get_model_name(), openai_client=get_client())
     agent = Agent(
         name="Assistant",
         instructions="Use the tools to return airline baggage policy info from the text files in the data directory.",
         mcp_servers=[mcp_server],
-        model=model_name,
+        model=model,
+    )
+    async for event in run_agent(agent, message):
+        yield event
+
+async def run_agent(agent: Agent, message: str, logger=logger):
+    """Stream an agent run as StreamEvents, logging it (to the caller's endpoint logger) and recording its tokens."""
+    logger.info("Running agent", extra={"input": truncate(message)})
+    result = Runner.run_streamed(starting_agent=agent, input=message)
+    disconnect.on_cancel(result.cancel, "agent_run")
+    async for event in stream_run_events(result):
+        yield event
+    usage = result.context_wrapper.usage
+    metrics.record_tokens("default", get_model_name(), usage.input_tokens, usage.output_tokens)
+    logger.info(
+        "Agent finished",
+        extra={"output": truncate(result.final_output), "output_sha256": digest(result.final_output)},
+    )
+
+async def stream_run_events(result):
+    """Translate an Agents SDK streamed run into StreamEvents as it progresses."""
+    tool_names = {}
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            yield sse.token(event.data.delta)
+        elif event.type == "run_item_stream_event":
+            raw_item = event.item.raw_item
+            if event.name == "tool_called":
+                name = getattr(raw_item, "name", event.item.type)
+                tool_names[getattr(raw_item, "call_id", None)] = name
+                yield sse.tool_call(name, getattr(raw_item, "arguments", None))
+            elif event.name == "tool_output":
+                call_id = raw_item.get("call_id") if isinstance(raw_item, dict) else getattr(raw_item, "call_id", None)
+                yield sse.tool_result(tool_names.get(call_id, "tool"), event.item.output)
+    # stream_events() ends quietly when its task is cancelled; don't carry on as if the run finished
+    if asyncio.current_task().cancelling():
+        raise asyncio.CancelledError()
+
+@lru_cache(maxsize=1)
+def filesystem_server_spec():
+    data_dir = os.getenv("MCP_FILESYSTEM_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    # Prefer a locally installed server; npx only resolves the pinned package once per pool start
+    if shutil.which("mcp-server-filesystem"):
+        return mcp_pool.spec_from_env("Filesystem Server", "MCP_FILESYSTEM_COMMAND", "mcp-server-filesystem", [data_dir])
+    return mcp_pool.spec_from_env(
+        "Filesystem Server, via npx",
+        "MCP_FILESYSTEM_COMMAND",
+        "npx",
+        ["-y", "@modelcontextprotocol/server-filesystem@2025.8.18", data_dir],
     )
-    print(f"\n\nRunning: {message}")
-    result = await Runner.run(starting_agent=agent, input=message)
-    print(result.final_output)
-    return result.final_output
 
 async def run_mcp(message: str):
-    if not shutil.which("npx"):
-        raise RuntimeError("npx is not installed. Please install it with `npm install -g npx`.")
-
-    # async with MCPServerStdio(
-    #     name="Flight Info Bot",
-    #     params={
-    #         "command": "npx",
-    #         "args": ["/Users/billhorn/code/javascript/acme-air-demo", message],
-    #         "cache_tools_list": "True"
-    #     },
-    # ) as server:
-    #     trace_id = gen_trace_id()
-    #     with trace(workflow_name="MCP Filesystem Example", trace_id=trace_id):
-    #         print(f"View trace: https://platform.openai.com/traces/{trace_id}\n")
-    #         return await run(server, message)
-
-    async with MCPServerStdio(
-        name="Filesystem Server, via npx",
-        params={
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-filesystem@2025.8.18", "/Users/billhorn/code/python/langchainpostgres004/data"],
-            "cache_tools_list": "True",
-        },
-    ) as server:
-        return await run(server, message)
+    async with mcp_pool.session(filesystem_server_spec()) as server:
+        async for event in run(server, message):
+            yield event
+
+async def run_policy_search(message: str):
+    model = OpenAIChatCompletionsModel(model=get_model_name(), openai_client=get_client())
+    agent = Agent(
+        name="Assistant",
+        instructions=(
+            "Answer questions about airline baggage policy. Call search_airline_policies once with the "
+            "customer's question and answer only from the sections it returns."
+        ),
+        tools=[search_airline_policies],
+        model=model,
+    )
+    async for event in run_agent(agent, message):
+        yield event
+
+async def run_airline_info(message: str):
+    backend = run_mcp if AIRLINE_INFO_BACKEND == "mcp" else run_policy_search
+    async for event in backend(message):
+        yield event
+
+async def warm_up():
+    """Start the MCP server pool, or index the policy files, before the first request."""
+    if AIRLINE_INFO_BACKEND == "mcp":
+        mcp_pool.start(filesystem_server_spec())
+    else:
+        await policy_index.build()
@@ -1,43 +1,83 @@
 import os
-import shutil
+from functools import lru_cache
 
-from agents import Agent, Runner, set_default_openai_api, set_default_openai_client, set_tracing_disabled
-from agents.mcp import MCPServer, MCPServerStdio
-from openai import AsyncOpenAI
+from agents import Agent, OpenAIChatCompletionsModel, function_tool, set_tracing_disabled
+from agents.mcp import MCPServer
 from dotenv import load_dotenv
 
+import endpoints
+import flight_index
+import mcp_pool
+from app_logging import get_logger
+from mcpfunction import run_agent
+from llm_clients import get_client, get_model_name
+
 load_dotenv()
+set_tracing_disabled(disabled=True)
+logger = get_logger("flight_info")
+
+# "index" looks flights up in-process; "mcp" uses the Node Flight Info Bot MCP server
+FLIGHT_INFO_BACKEND = endpoints.backend("flight_info")
+
+@function_tool
+async def find_flights(cities: list[str], departs_after: str | None = None, departs_before: str | None = None) -> str:
+    """Look up departing flights for one or more cities or airport codes in a single call.
+
+    Args:
+        cities: Every city name or airport code the customer asked about, e.g. ["Chicago", "SEA"].
+        departs_after: Only flights departing at or after this time, e.g. "13:00" or "1 PM".
+        departs_before: Only flights departing at or before this time.
+    """
+    try:
+        results = await flight_index.find_flights(cities, departs_after, departs_before)
+    except ValueError as e:
+        return str(e)
+    logger.info("Flight lookup", extra={"cities": cities, "flights": sum(len(f) for f in results.values())})
+    return flight_index.format_results(results, windowed=bool(departs_after or departs_before))
 
 async def run(mcp_server: MCPServer, message: str):
-    client = AsyncOpenAI(
-        api_key = os.getenv("API_KEY"),
-        base_url = os.getenv("BASE_URL")
-    )
-    set_default_openai_client(client=client, use_for_tracing=False)
-    set_default_openai_api("chat_completions")
-    set_tracing_disabled(disabled=True)
-    model_name = os.getenv("LLM_MODEL")
+    model = OpenAIChatCompletionsModel(model=get_model_name(), openai_client=get_client())
     agent = Agent(
         name="Assistant",
         instructions="Use the tools based on the user prompt.",
         mcp_servers=[mcp_server],
-        model=model_name,
+        model=model,
     )
-    print(f"\n\nRunning: {message}")
-    result = await Runner.run(starting_agent=agent, input=message)
-    print(result.final_output)
-    return result.final_output
+    async for event in run_agent(agent, message, logger):
+        yield event
+
+@lru_cache(maxsize=1)
+def flight_info_server_spec():
+    package_dir = os.getenv("MCP_FLIGHT_INFO_PACKAGE", "/Users/billhorn/code/javascript/acme-air-demo")
+    return mcp_pool.spec_from_env("Flight Info Bot", "MCP_FLIGHT_INFO_COMMAND", "npx", [package_dir])
 
 async def run_mcp_custom(message: str):
-    if not shutil.which("npx"):
-        raise RuntimeError("npx is not installed or not found in PATH. Please install Node.js and ensure npx is available.")
-    
-    async with MCPServerStdio(
-        name="Flight Info Bot",
-        params={
-            "command": "npx",
-            "args": ["/Users/billhorn/code/javascript/acme-air-demo", message],
-            "cache_tools_list": "True",
-        },
-    ) as server:
-        return await run(server, message)
\ No newline at end of file
+    async with mcp_pool.session(flight_info_server_spec()) as server:
+        async for event in run(server, message):
+            yield event
+
+async def run_flight_lookup(message: str):
+    model = OpenAIChatCompletionsModel(model=get_model_name(), openai_client=get_client())
+    agent = Agent(
+        name="Assistant",
+        instructions=(
+            "Answer questions about departing flights. Call find_flights once with every city or airport "
+            "the user mentions, plus a departure time window if they give one."
+        ),
+        tools=[find_flights],
+        model=model,
+    )
+    async for event in run_agent(agent, message, logger):
+        yield event
+
+async def run_flight_info(message: str):
+    backend = run_mcp_custom if FLIGHT_INFO_BACKEND == "mcp" else run_flight_lookup
+    async for event in backend(message):
+        yield event
+
+async def warm_up():
+    """Start the MCP server pool, or load the flight data, before the first request."""
+    if FLIGHT_INFO_BACKEND == "mcp":
+        mcp_pool.start(flight_info_server_spec())
+    else:
+        await flight_index.load()
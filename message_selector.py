@@ -0,0 +1,113 @@
+import math
+import os
+import re
+from dataclasses import dataclass
+
+import metrics
+from app_logging import get_logger
+from llm_clients import get_client, get_model_name
+
+# "scorer" never calls the LLM, "llm" always does (the old behaviour), "auto" only when the scorer is unsure
+SELECTOR_MODE = os.getenv("MESSAGE_SELECTOR_MODE", "auto")
+# Top two candidates closer than this (in score units) are ambiguous
+SELECTOR_MARGIN = float(os.getenv("MESSAGE_SELECTOR_MARGIN", "0.1"))
+
+LIST_WEIGHT = 2.0
+RECENCY_WEIGHT = 0.05
+# Larger than LIST_WEIGHT: raw page text never outranks the agents' own messages
+PAGE_DUMP_PENALTY = 2.5
+# Messages of this many characters or more count as fully detailed
+DETAIL_SATURATION_CHARS = 4000
+
+BULLET_LINE = re.compile(r"^\s*(?:[-*•+]|\d{1,2}[.)])\s+\S")
+TERMINATE = re.compile(r"\s*\bTERMINATE\b[\s.!]*$")
+# Boilerplate MultimodalWebSurfer puts around the raw text of the page it is looking at
+PAGE_DUMP = re.compile(r"The viewport shows \d+% of the webpage|The following text is visible in the viewport", re.I)
+
+logger = get_logger("web_surfer")
+
+
+@dataclass
+class Candidate:
+    index: int
+    text: str
+    bullets: int
+    chars: int
+    score: float
+
+
+def strip_terminate(text: str):
+    """Remove the trailing TERMINATE the assistant uses to end the group chat."""
+    return TERMINATE.sub("", text).rstrip()
+
+
+def score_message(text: str, index: int, total: int):
+    """Score one message: list structure first, then length, then recency; raw page text is penalized."""
+    body = strip_terminate(text).strip()
+    bullets = sum(1 for line in body.splitlines() if BULLET_LINE.match(line))
+    chars = len(body)
+    if not chars:
+        return Candidate(index, body, 0, 0, 0.0)
+    # A list needs at least two items; a single dash line is usually prose
+    score = LIST_WEIGHT if bullets >= 2 else 0.0
+    score += min(math.log1p(chars) / math.log1p(DETAIL_SATURATION_CHARS), 1.0)
+    score += RECENCY_WEIGHT * (index + 1) / total
+    if PAGE_DUMP.search(body):
+        score -= PAGE_DUMP_PENALTY
+    return Candidate(index, body, bullets, chars, score)
+
+
+def rank_messages(messages: list):
+    """Return the candidates best first, plus whether the top two are too close to call."""
+    candidates = sorted(
+        (score_message(text, i, len(messages)) for i, text in enumerate(messages)),
+        key=lambda c: c.score,
+        reverse=True,
+    )
+    ambiguous = (
+        len(candidates) > 1
+        and candidates[0].score - candidates[1].score < SELECTOR_MARGIN
+        and candidates[0].text != candidates[1].text
+    )
+    return candidates, ambiguous
+
+
+async def llm_select(messages: list):
+    """Ask the LOCAL model to pick the bullet-point message."""
+    # Create a prompt with all numbered messages
+    messages_text = ""
+    for i, msg in enumerate(messages, 1):
+        messages_text += f"\n\n---MESSAGE {i}---\n{msg}"
+
+    prompt = f"""You have received multiple messages below. Please identify and return ONLY the message that is formatted with bullet points. If multiple messages have bullet points, choose the most comprehensive one. If no messages have bullet points, return the most detailed message.
+
+Return ONLY the exact content of the selected message, with no additional commentary, explanations, or modifications.
+
+Here are the messages:{messages_text}"""
+
+    model = get_model_name("LOCAL")
+    response = await get_client("LOCAL").chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "You are a helpful assistant that selects the best formatted message."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0
+    )
+    if response.usage:
+        metrics.record_tokens("LOCAL", model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content
+
+
+async def select_message(messages: list, mode: str = None):
+    """Pick the answer to show from the team's messages. Returns (text, method)."""
+    mode = mode or SELECTOR_MODE
+    if mode == "llm":
+        return strip_terminate(await llm_select(messages)), "llm"
+    candidates, ambiguous = rank_messages(messages)
+    if ambiguous and mode == "auto":
+        # Only the close contenders go to the model, which keeps the prompt small
+        contenders = [c.text for c in candidates if candidates[0].score - c.score < SELECTOR_MARGIN]
+        logger.debug("Message selection is ambiguous", extra={"contenders": len(contenders)})
+        return strip_terminate(await llm_select(contenders)), "llm"
+    return candidates[0].text, "scorer"
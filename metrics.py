@@ -0,0 +1,222 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+import httpx
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# OpenTelemetry spans are opt-in and need opentelemetry-api (plus an SDK/exporter configured by the deployment)
+TRACING_ENABLED = os.getenv("OTEL_TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+_tracer = trace.get_tracer("agents-demo") if TRACING_ENABLED and trace is not None else None
+
+# Most stages are sub-second; agent runs and browser sessions take minutes
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "agents_time_to_first_token_seconds", "Time from request to the first answer token", ["endpoint"],
+    buckets=_LATENCY_BUCKETS,
+)
+STREAM_DURATION = Histogram(
+    "agents_stream_duration_seconds", "Total duration of a streamed response", ["endpoint", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_FIRST_BYTE = Histogram(
+    "agents_llm_first_byte_seconds", "LLM HTTP call latency until response headers", ["profile", "model", "operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_CALL = Histogram(
+    "agents_llm_call_seconds", "LLM call latency until the response is fully read", ["profile", "model", "operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "agents_llm_tokens", "Tokens per LLM call, or per run for multi-call agents", ["profile", "model", "direction"],
+    buckets=_TOKEN_BUCKETS,
+)
+MCP_SPAWN = Histogram(
+    "agents_mcp_spawn_seconds", "MCP server subprocess start until its tools are listed", ["server"],
+    buckets=_LATENCY_BUCKETS,
+)
+MCP_TOOL_CALL = Histogram(
+    "agents_mcp_tool_call_seconds", "MCP tool call latency", ["server", "tool"],
+    buckets=_LATENCY_BUCKETS,
+)
+SQL_STAGE = Histogram(
+    "agents_sql_stage_seconds", "SQL prepare/execute/fetch time", ["engine", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+BROWSER_STAGE = Histogram(
+    "agents_browser_stage_seconds", "Browser pool and screenshot time", ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+RETRIEVAL_STAGE = Histogram(
+    "agents_retrieval_seconds", "Policy index search and re-index time", ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+ENDPOINT_LOAD = Histogram(
+    "agents_endpoint_load_seconds", "Time to import and warm up an endpoint's framework", ["endpoint", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+PROMPT_CONTEXT_TOKENS = Histogram(
+    "agents_prompt_context_tokens", "Tokens of schema context per prompt, as sent and if the full schema were sent",
+    ["endpoint", "context"], buckets=_TOKEN_BUCKETS,
+)
+SQL_GUARDRAIL_REJECTIONS = Counter(
+    "agents_sql_guardrail_rejections_total", "Generated SQL refused by the guardrails", ["engine", "reason"]
+)
+SQL_GUARDRAIL_LIMITS_ADDED = Counter(
+    "agents_sql_guardrail_limits_added_total", "Generated SELECTs given a default LIMIT", ["engine"]
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "agents_response_cache_lookups_total", "Response cache lookups by result: exact_hit, semantic_hit or miss",
+    ["endpoint", "result"],
+)
+RESPONSE_CACHE_STORES = Counter(
+    "agents_response_cache_stores_total", "Streamed answers stored in the response cache", ["endpoint"]
+)
+ADMISSION_WAIT = Histogram(
+    "agents_admission_wait_seconds", "Time a request queued for an endpoint slot", ["endpoint"],
+    buckets=_LATENCY_BUCKETS,
+)
+ADMISSION_IN_FLIGHT = Gauge("agents_admission_in_flight", "Requests holding an endpoint slot", ["endpoint"])
+ADMISSION_QUEUE_DEPTH = Gauge("agents_admission_queue_depth", "Requests waiting for an endpoint slot", ["endpoint"])
+ADMISSION_REJECTIONS = Counter(
+    "agents_admission_rejections_total", "Requests turned away with 429/503", ["endpoint", "reason"]
+)
+CLIENT_DISCONNECTS = Counter(
+    "agents_client_disconnects_total", "Streams cancelled because the client went away", ["endpoint"]
+)
+RECLAIMED_WORK = Counter(
+    "agents_reclaimed_work_total", "LLM streams, agent runs, SQL queries and browser sessions stopped early", ["kind"]
+)
+
+
+@contextmanager
+def _timed(histogram: Histogram, span_name: str, labels: dict):
+    span = _tracer.start_as_current_span(span_name, attributes=labels) if _tracer else nullcontext()
+    started = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def timed(histogram: Histogram, span_name: str, **labels):
+    """Time a block into `histogram` (and an OpenTelemetry span when tracing is on)."""
+    if not METRICS_ENABLED:
+        return nullcontext()
+    return _timed(histogram, span_name, labels)
+
+
+def observe(histogram: Histogram, value: float, **labels):
+    if METRICS_ENABLED:
+        histogram.labels(**labels).observe(value)
+
+
+def inc(counter: Counter, **labels):
+    if METRICS_ENABLED:
+        counter.labels(**labels).inc()
+
+
+def set_gauge(gauge: Gauge, value: float, **labels):
+    if METRICS_ENABLED:
+        gauge.labels(**labels).set(value)
+
+
+def record_tokens(profile: str, model: str, input_tokens, output_tokens):
+    """Record token usage for one LLM call; unknown (None) counts are skipped."""
+    if not METRICS_ENABLED:
+        return
+    if input_tokens is not None:
+        LLM_TOKENS.labels(profile=profile, model=model or "", direction="in").observe(input_tokens)
+    if output_tokens is not None:
+        LLM_TOKENS.labels(profile=profile, model=model or "", direction="out").observe(output_tokens)
+
+
+async def instrument_stream(endpoint: str, events):
+    """Pass StreamEvents through, timing the first token and the whole stream."""
+    if not METRICS_ENABLED:
+        async for event in events:
+            yield event
+        return
+    # Not made the current span: the generator is suspended between events
+    span = _tracer.start_span(f"stream {endpoint}") if _tracer else None
+    started = time.perf_counter()
+    first_token = True
+    outcome = "cancelled"
+    try:
+        async for event in events:
+            if first_token and event.event == "token":
+                first_token = False
+                TIME_TO_FIRST_TOKEN.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+            yield event
+        outcome = "ok"
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        STREAM_DURATION.labels(endpoint=endpoint, outcome=outcome).observe(time.perf_counter() - started)
+        if span is not None:
+            span.set_attribute("outcome", outcome)
+            span.end()
+
+
+class _TimedByteStream(httpx.AsyncByteStream):
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper timing every LLM HTTP call to headers and to the end of the body."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, profile: str, model: str):
+        self._transport = transport
+        self._profile = profile
+        self._model = model or ""
+
+    async def handle_async_request(self, request):
+        labels = {"profile": self._profile, "model": self._model, "operation": request.url.path.rsplit("/", 1)[-1]}
+        started = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        LLM_FIRST_BYTE.labels(**labels).observe(time.perf_counter() - started)
+
+        def on_close():
+            LLM_CALL.labels(**labels).observe(time.perf_counter() - started)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TimedByteStream(response.stream, on_close),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def instrument_transport(transport: httpx.AsyncBaseTransport, profile: str, model: str):
+    return InstrumentedTransport(transport, profile, model) if METRICS_ENABLED else transport
+
+
+def render():
+    """Prometheus exposition of all metrics: (body, content type)."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from operator import itemgetter
+
+import metrics
+from app_logging import get_logger
+from search_terms import tokenize
+
+POLICY_DATA_DIR = os.getenv(
+    "POLICY_DATA_DIR",
+    os.getenv("MCP_FILESYSTEM_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")),
+)
+POLICY_FILE_EXTENSIONS = tuple(os.getenv("POLICY_FILE_EXTENSIONS", ".txt,.md").split(","))
+POLICY_TOP_K = int(os.getenv("POLICY_TOP_K", "3"))
+# The directory is re-scanned for changed files at most this often (seconds)
+POLICY_REINDEX_INTERVAL = float(os.getenv("POLICY_REINDEX_INTERVAL", "5"))
+# Files this large are indexed through mmap and their text is read back on demand instead of kept in memory
+POLICY_MMAP_MIN_BYTES = int(os.getenv("POLICY_MMAP_MIN_BYTES", str(1024 * 1024)))
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+SECTION_SEPARATOR = re.compile(rb"^-{5,}[ \t]*\r?$", re.M)
+
+logger = get_logger("airline_info")
+
+
+@dataclass
+class Section:
+    path: str
+    number: int
+    start: int
+    end: int
+    length: int
+    # None for memory-mapped files: read back from disk when returned
+    text: str = None
+
+
+@dataclass
+class _IndexedFile:
+    signature: tuple
+    section_ids: list
+    terms: set
+
+
+class PolicyIndex:
+    """BM25 index over the sections of every policy file in a directory, kept up to date incrementally."""
+
+    def __init__(self, directory: str = POLICY_DATA_DIR):
+        self.directory = directory
+        self.sections = {}
+        # term -> {section id: term frequency}
+        self.postings = {}
+        self.files = {}
+        self.total_length = 0
+        # Per-section BM25 length normalization, recomputed after every re-index
+        self.norms = {}
+        self.next_id = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def _scan(self):
+        """Current (mtime, size) of every policy file under the directory."""
+        found = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(POLICY_FILE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found[path] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def _remove_file(self, path: str):
+        indexed = self.files.pop(path)
+        for section_id in indexed.section_ids:
+            section = self.sections.pop(section_id)
+            self.total_length -= section.length
+        for term in indexed.terms:
+            postings = self.postings[term]
+            for section_id in indexed.section_ids:
+                postings.pop(section_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def _add_file(self, path: str, signature: tuple):
+        section_ids = []
+        file_terms = set()
+        with open(path, "rb") as f:
+            if signature[1] >= POLICY_MMAP_MIN_BYTES:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                keep_text = False
+            else:
+                data = f.read()
+                keep_text = True
+            try:
+                bounds = [0]
+                for match in SECTION_SEPARATOR.finditer(data):
+                    bounds.extend((match.start(), match.end()))
+                bounds.append(len(data))
+                for number, (start, end) in enumerate(zip(bounds[::2], bounds[1::2])):
+                    text = bytes(data[start:end]).decode("utf-8", errors="replace").strip()
+                    terms = Counter(tokenize(text))
+                    if not terms:
+                        continue
+                    section_id = self.next_id
+                    self.next_id += 1
+                    length = sum(terms.values())
+                    self.sections[section_id] = Section(
+                        path, number, start, end, length, text if keep_text else None
+                    )
+                    self.total_length += length
+                    for term, count in terms.items():
+                        self.postings.setdefault(term, {})[section_id] = count
+                    file_terms.update(terms)
+                    section_ids.append(section_id)
+            finally:
+                if not keep_text:
+                    data.close()
+        self.files[path] = _IndexedFile(signature, section_ids, file_terms)
+
+    def refresh(self, force: bool = False):
+        """Re-index files that were added, changed or removed since the last check. Blocking."""
+        if not force and time.monotonic() - self.checked_at < POLICY_REINDEX_INTERVAL:
+            return
+        with self.lock:
+            found = self._scan()
+            changed = [
+                path for path, signature in found.items()
+                if path not in self.files or self.files[path].signature != signature
+            ]
+            removed = [path for path in self.files if path not in found]
+            if changed or removed:
+                with metrics.timed(metrics.RETRIEVAL_STAGE, "policy_index.reindex", stage="reindex"):
+                    for path in removed:
+                        self._remove_file(path)
+                    for path in changed:
+                        if path in self.files:
+                            self._remove_file(path)
+                        try:
+                            self._add_file(path, found[path])
+                        except OSError as e:
+                            logger.warning("Could not index policy file", extra={"path": path, "error": str(e)})
+                average_length = self.total_length / len(self.sections) if self.sections else 0
+                self.norms = {
+                    section_id: K1 * (1 - B + B * section.length / average_length)
+                    for section_id, section in self.sections.items()
+                }
+                logger.info(
+                    "Policy index updated",
+                    extra={"changed": len(changed), "removed": len(removed), "sections": len(self.sections)},
+                )
+            self.checked_at = time.monotonic()
+
+    def _text(self, section: Section):
+        if section.text is not None:
+            return section.text
+        with open(section.path, "rb") as f:
+            f.seek(section.start)
+            return f.read(section.end - section.start).decode("utf-8", errors="replace").strip()
+
+    def search(self, query: str, top_k: int = POLICY_TOP_K):
+        """The top_k sections for `query` as (score, section, text), best first."""
+        with self.lock:
+            count = len(self.sections)
+            norms = self.norms
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for section_id, frequency in postings.items():
+                    scores[section_id] = scores.get(section_id, 0.0) + idf * frequency * (K1 + 1) / (
+                        frequency + norms[section_id]
+                    )
+            best = heapq.nlargest(top_k, scores.items(), key=itemgetter(1))
+            hits = [(score, self.sections[section_id]) for section_id, score in best]
+        return [(score, section, self._text(section)) for score, section in hits]
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "files": len(self.files),
+            "sections": len(self.sections),
+            "terms": len(self.postings),
+        }
+
+
+_index = PolicyIndex()
+
+
+def format_hits(hits, directory: str = POLICY_DATA_DIR):
+    if not hits:
+        return "No matching policy sections found."
+    return "\n\n".join(
+        f"[{os.path.relpath(section.path, directory)}, section {section.number + 1}]\n{text}"
+        for _, section, text in hits
+    )
+
+
+async def search(query: str, top_k: int = POLICY_TOP_K):
+    """Search the policy files, picking up any changes first; the blocking work runs in a thread."""
+    await asyncio.to_thread(_index.refresh)
+    with metrics.timed(metrics.RETRIEVAL_STAGE, "policy_index.search", stage="search"):
+        return await asyncio.to_thread(_index.search, query, top_k)
+
+
+async def build():
+    """Index the directory up front so the first request doesn't pay for it."""
+    await asyncio.to_thread(_index.refresh, True)
+
+
+def index_stats():
+    return _index.stats()
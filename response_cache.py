@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import metrics
+import sse
+from app_logging import get_logger
+from llm_clients import get_client
+
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")  # memory | sqlite
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# The embedding-similarity tier is only used when an embedding model is configured
+EMBEDDING_MODEL = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL")
+EMBEDDING_PROFILE = os.getenv("RESPONSE_CACHE_EMBEDDING_PROFILE", "default")
+SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+
+logger = get_logger("response_cache")
+
+
+def normalize_prompt(prompt: str):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip(".?!")
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class _Entry:
+    scope: str
+    value: dict
+    embedding: list
+    size: int
+    created_at: float
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache with TTL, entry-count and byte limits."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def _expired(self, entry: _Entry):
+        return self.ttl > 0 and time.time() - entry.created_at > self.ttl
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    async def set(self, key, scope, value, embedding=None):
+        if key in self._entries:
+            self._remove(key)
+        size = len(json.dumps(value))
+        self._entries[key] = _Entry(scope, value, embedding, size, time.time())
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def candidates(self, scope):
+        return [
+            (key, entry.embedding)
+            for key, entry in self._entries.items()
+            if entry.scope == scope and entry.embedding is not None and not self._expired(entry)
+        ]
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SQLiteCacheBackend:
+    """On-disk cache in a local SQLite file, with the same LRU/TTL/size limits as the memory backend."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                value TEXT NOT NULL,
+                embedding TEXT,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND (? <= 0 OR created_at > ?)",
+                (key, self.ttl, time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return json.loads(row[0])
+
+    def _set(self, key, scope, value, embedding):
+        payload = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, scope, payload, json.dumps(embedding) if embedding else None, len(payload), now, now),
+            )
+            if self.ttl > 0:
+                self.evictions += self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl,)).rowcount
+            count, total = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM responses").fetchone()
+            for old_key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                count -= 1
+                total -= size
+                self.evictions += 1
+            self._conn.commit()
+
+    def _candidates(self, scope):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, embedding FROM responses WHERE scope = ? AND embedding IS NOT NULL AND (? <= 0 OR created_at > ?)",
+                (scope, self.ttl, time.time() - self.ttl),
+            ).fetchall()
+        return [(key, json.loads(embedding)) for key, embedding in rows]
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, scope, value, embedding=None):
+        await asyncio.to_thread(self._set, key, scope, value, embedding)
+
+    async def candidates(self, scope):
+        return await asyncio.to_thread(self._candidates, scope)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM responses").fetchone()
+        return {"backend": "sqlite", "entries": count, "bytes": total, "evictions": self.evictions}
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "sqlite":
+        return SQLiteCacheBackend()
+    if name == "memory":
+        return MemoryCacheBackend()
+    raise ValueError(f"Unknown response cache backend: {name}")
+
+
+@dataclass
+class CacheLookup:
+    endpoint: str
+    scope: str
+    key: str
+    prompt: str
+    embedding: list = None
+    answer: str = None
+    # The answer's "truncated" frame, if it was cut short
+    truncated: str = None
+    tier: str = None
+
+
+_backend = None
+_counters = {}
+
+
+# Names in /cacheStats -> the lookup metric's result label
+_LOOKUP_RESULTS = {"exact_hits": "exact_hit", "semantic_hits": "semantic_hit", "misses": "miss"}
+
+
+def _count(endpoint: str, name: str):
+    counters = _counters.setdefault(endpoint, {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0})
+    counters[name] += 1
+    if name == "stores":
+        metrics.inc(metrics.RESPONSE_CACHE_STORES, endpoint=endpoint)
+    else:
+        metrics.inc(metrics.RESPONSE_CACHE_LOOKUPS, endpoint=endpoint, result=_LOOKUP_RESULTS[name])
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+
+async def _embed(text: str):
+    response = await get_client(EMBEDDING_PROFILE).embeddings.create(model=EMBEDDING_MODEL, input=text)
+    return response.data[0].embedding
+
+
+async def lookup(endpoint: str, prompt: str, model: str):
+    """Look a prompt up in the exact tier, then (if enabled) the embedding-similarity tier."""
+    normalized = normalize_prompt(prompt)
+    scope = f"{endpoint}:{hashlib.sha256((model or '').encode()).hexdigest()[:16]}"
+    key = hashlib.sha256(f"{scope}\0{normalized}".encode()).hexdigest()
+    result = CacheLookup(endpoint=endpoint, scope=scope, key=key, prompt=normalized)
+    if not CACHE_ENABLED:
+        return result
+    backend = get_backend()
+
+    value = await backend.get(key)
+    if value is not None:
+        result.answer, result.truncated, result.tier = value["answer"], value.get("truncated"), "exact"
+        _count(endpoint, "exact_hits")
+        return result
+
+    if EMBEDDING_MODEL:
+        try:
+            result.embedding = await _embed(normalized)
+        except Exception as e:
+            logger.warning("Response cache embedding failed", extra={"error": str(e)})
+        if result.embedding is not None:
+            best_key, best_score = None, SIMILARITY_THRESHOLD
+            for candidate_key, embedding in await backend.candidates(scope):
+                score = _cosine(result.embedding, embedding)
+                if score >= best_score:
+                    best_key, best_score = candidate_key, score
+            if best_key is not None:
+                value = await backend.get(best_key)
+                if value is not None:
+                    result.answer, result.truncated, result.tier = value["answer"], value.get("truncated"), "semantic"
+                    _count(endpoint, "semantic_hits")
+                    return result
+
+    _count(endpoint, "misses")
+    return result
+
+
+async def record(cache_lookup: CacheLookup, events):
+    """Pass events through and store the streamed answer once the run completes successfully."""
+    answer = []
+    truncated = None
+    cacheable = CACHE_ENABLED
+    async for event in events:
+        if event.event == "token":
+            answer.append(event.data)
+        elif event.event == "truncated":
+            truncated = event.data
+        elif event.event == "cache_control" and event.data == "no-store":
+            cacheable = False
+        yield event
+    if cacheable and answer:
+        value = {"answer": "".join(answer), "prompt": cache_lookup.prompt}
+        if truncated is not None:
+            value["truncated"] = truncated
+        await get_backend().set(cache_lookup.key, cache_lookup.scope, value, cache_lookup.embedding)
+        _count(cache_lookup.endpoint, "stores")
+
+
+async def replay(answer: str, truncated: str = None):
+    yield sse.token(answer)
+    if truncated is not None:
+        yield sse.StreamEvent("truncated", truncated)
+
+
+def cache_stats():
+    stats = get_backend().stats() if CACHE_ENABLED else {"backend": None}
+    stats["endpoints"] = _counters
+    return stats
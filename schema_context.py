@@ -0,0 +1,374 @@
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+import metrics
+from app_logging import get_logger
+from db_pool import acquire
+from search_terms import tokenize
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Most tables described in full for one question
+SCHEMA_CONTEXT_MAX_TABLES = int(os.getenv("SCHEMA_CONTEXT_MAX_TABLES", "5"))
+# Wider tables only list their key columns and the columns the question mentions
+SCHEMA_CONTEXT_MAX_COLUMNS = int(os.getenv("SCHEMA_CONTEXT_MAX_COLUMNS", "25"))
+# Names of the remaining tables are listed up to this many
+SCHEMA_CONTEXT_MAX_OTHER_TABLES = int(os.getenv("SCHEMA_CONTEXT_MAX_OTHER_TABLES", "30"))
+SCHEMA_CONTEXT_EXAMPLES = int(os.getenv("SCHEMA_CONTEXT_EXAMPLES", "3"))
+# Optional JSON list of {"question": ..., "sql": ...} added to the built-in examples
+SQL_EXAMPLES_PATH = os.getenv("SQL_EXAMPLES_PATH")
+# tiktoken encoding for the token report; counts are estimated if it can't be loaded
+TOKEN_ENCODING = os.getenv("SCHEMA_CONTEXT_TOKEN_ENCODING", "cl100k_base")
+
+COLUMNS_QUERY = """
+    SELECT cls.relname AS table_name,
+           att.attname AS column_name,
+           format_type(att.atttypid, att.atttypmod) AS data_type,
+           att.attnotnull AS not_null,
+           coalesce(att.attnum = ANY(pk.conkey), false) AS primary_key,
+           col_description(cls.oid, att.attnum) AS column_comment,
+           obj_description(cls.oid, 'pg_class') AS table_comment
+    FROM pg_class cls
+    JOIN pg_attribute att ON att.attrelid = cls.oid AND att.attnum > 0 AND NOT att.attisdropped
+    LEFT JOIN pg_constraint pk ON pk.conrelid = cls.oid AND pk.contype = 'p'
+    WHERE cls.relnamespace = current_schema()::regnamespace AND cls.relkind IN ('r', 'p', 'v', 'm')
+    ORDER BY cls.relname, att.attnum
+"""
+FOREIGN_KEYS_QUERY = """
+    SELECT src.relname AS table_name,
+           array(SELECT attname FROM pg_attribute WHERE attrelid = con.conrelid AND attnum = ANY(con.conkey)) AS columns,
+           dst.relname AS referenced_table,
+           array(SELECT attname FROM pg_attribute WHERE attrelid = con.confrelid AND attnum = ANY(con.confkey))
+               AS referenced_columns
+    FROM pg_constraint con
+    JOIN pg_class src ON src.oid = con.conrelid
+    JOIN pg_class dst ON dst.oid = con.confrelid
+    WHERE con.contype = 'f' AND src.relnamespace = current_schema()::regnamespace
+"""
+
+# (question, SQL) pairs; examples whose tables are missing from the live schema are left out
+EXAMPLES = [
+    ("List the database tables",
+     "SELECT table_name FROM information_schema.tables WHERE table_type = 'BASE TABLE' AND table_schema = 'public';"),
+    ("List all the columns in the airports table",
+     "SELECT column_name FROM information_schema.columns WHERE table_name = 'airports';"),
+    ("Show me airport locations", "SELECT airport_name, location FROM airports;"),
+    ("Show me flight delays.", "SELECT delay_date, flight_delay_reason FROM flight_delays;"),
+    ("What is the average delay at each airport?",
+     "SELECT a.airport_name, avg(d.flight_delay_minutes) AS average_delay_minutes FROM flight_delays d "
+     "JOIN airports a ON a.airport_id = d.airport_id GROUP BY a.airport_name ORDER BY average_delay_minutes DESC;"),
+    ("Which pilots had the most delays?",
+     "SELECT p.first_name, p.last_name, count(*) AS delays FROM flight_delays d "
+     "JOIN pilots p ON p.pilot_id = d.pilot_id GROUP BY p.pilot_id, p.first_name, p.last_name "
+     "ORDER BY delays DESC LIMIT 10;"),
+    ("What are the most common delay reasons?",
+     "SELECT flight_delay_reason, count(*) AS delays FROM flight_delays GROUP BY flight_delay_reason "
+     "ORDER BY delays DESC;"),
+    ("How many delays were there per month?",
+     "SELECT date_trunc('month', delay_date) AS month, count(*) AS delays FROM flight_delays GROUP BY month "
+     "ORDER BY month;"),
+    ("Which pilots were hired most recently?",
+     "SELECT first_name, last_name, hire_date FROM pilots ORDER BY hire_date DESC LIMIT 10;"),
+]
+# Words common to questions about any table, ignored when matching
+QUESTION_WORDS = frozenset(
+    "all are did get give had has have list many me much show tell there was were which who".split()
+)
+SQL_TABLE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)", re.I)
+
+logger = get_logger("sql_query_copilot")
+
+# None until loading starts, False while loading or if it failed
+_encoding = None
+_stats = {"requests": 0, "context_tokens": 0, "full_schema_tokens": 0}
+
+
+def _load_encoding():
+    """Blocking: tiktoken downloads the encoding on first use, with no timeout."""
+    global _encoding
+    try:
+        _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        logger.warning("Token counts are estimated", extra={"error": str(e)})
+
+
+def start_loading_encoding():
+    """Load the encoding once, in the background; until it is ready token counts are estimated.
+
+    A daemon thread, so an offline download that never returns doesn't hold up shutdown.
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            threading.Thread(target=_load_encoding, name="tiktoken-load", daemon=True).start()
+
+
+def count_tokens(text: str):
+    """Tokens in `text` with tiktoken, or about four characters per token while its encoding isn't loaded."""
+    if _encoding:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _terms(text: str):
+    return {term for term in tokenize(text) if term not in QUESTION_WORDS}
+
+
+def _name_terms(name: str):
+    return _terms(name.replace("_", " "))
+
+
+def _is_catalog(table: str):
+    return table.split(".")[0] in ("information_schema", "pg_catalog")
+
+
+@dataclass
+class Column:
+    name: str
+    data_type: str
+    not_null: bool
+    primary_key: bool
+    comment: str = None
+    # "table.column" this column joins to, from a foreign key or an <x>_id naming match
+    joins: str = None
+    terms: set = field(default_factory=set)
+
+
+@dataclass
+class Table:
+    name: str
+    columns: list
+    comment: str = None
+    terms: set = field(default_factory=set)
+
+
+@dataclass
+class Example:
+    question: str
+    sql: str
+    tables: set
+    terms: set
+
+
+def _load_examples():
+    pairs = list(EXAMPLES)
+    if SQL_EXAMPLES_PATH:
+        with open(SQL_EXAMPLES_PATH) as f:
+            pairs.extend((item["question"], item["sql"]) for item in json.load(f))
+    examples = []
+    for question, sql in pairs:
+        tables = {name.lower() for name in SQL_TABLE.findall(sql)}
+        examples.append(Example(question, sql, tables, _terms(question)))
+    return examples
+
+
+_examples = _load_examples()
+
+
+class Schema:
+    """The tables of one schema version, with the terms used to match questions against them."""
+
+    def __init__(self, tables: dict):
+        self.tables = tables
+        # How many tables each term appears in, to weight rare terms higher
+        self.table_frequency = {}
+        for table in tables.values():
+            for term in table.terms:
+                self.table_frequency[term] = self.table_frequency.get(term, 0) + 1
+        self.examples = [
+            example for example in _examples
+            if all(_is_catalog(name) or name in tables for name in example.tables)
+        ]
+        self.example_frequency = {}
+        for example in self.examples:
+            for term in example.terms:
+                self.example_frequency[term] = self.example_frequency.get(term, 0) + 1
+        # What the prompt would carry if every table, column and example were sent
+        self.full_text = render(self, list(tables), self.examples, None)
+        self._full_tokens = {}
+
+    def full_tokens(self):
+        """Tokens in the prompt the whole schema would take, counted like the selected context."""
+        counted_with = bool(_encoding)
+        if counted_with not in self._full_tokens:
+            self._full_tokens[counted_with] = count_tokens(self.full_text)
+        return self._full_tokens[counted_with]
+
+    def relevant_tables(self, terms: set):
+        """Tables whose name, columns or comments share terms with the question, best first."""
+        scores = {}
+        for table in self.tables.values():
+            score = 0.0
+            for term in terms & table.terms:
+                weight = 1 / self.table_frequency[term]
+                # A table named after the term outranks one that only has a column of that name
+                score += 3 * weight if term in _name_terms(table.name) else weight
+            if score:
+                scores[table.name] = score
+        ranked = sorted(scores, key=scores.get, reverse=True)[:SCHEMA_CONTEXT_MAX_TABLES]
+        if not ranked and len(self.tables) <= SCHEMA_CONTEXT_MAX_TABLES:
+            # Nothing matched, e.g. "list the tables": a small schema is cheap to send whole
+            return list(self.tables)
+        return ranked
+
+    def relevant_examples(self, terms: set, tables: list):
+        """Examples whose questions are most like this one, using only the tables being sent."""
+        scores = {}
+        for i, example in enumerate(self.examples):
+            if not all(_is_catalog(name) or name in tables for name in example.tables):
+                continue
+            score = sum(
+                math.log(1 + len(self.examples) / self.example_frequency[term]) for term in terms & example.terms
+            )
+            if score:
+                scores[i] = score
+        best = sorted(scores, key=scores.get, reverse=True)[:SCHEMA_CONTEXT_EXAMPLES]
+        return [self.examples[i] for i in best]
+
+
+def _render_table(table: Table, terms: set):
+    """CREATE TABLE text for `table`; `terms` of None lists every column."""
+    columns = table.columns
+    if terms is not None and len(columns) > SCHEMA_CONTEXT_MAX_COLUMNS:
+        columns = [c for c in columns if c.primary_key or c.joins or terms & c.terms]
+    lines = [f"-- {table.comment}"] if table.comment else []
+    lines.append(f"CREATE TABLE {table.name} (")
+    for i, column in enumerate(columns):
+        definition = f"  {column.name} {column.data_type}"
+        if column.primary_key:
+            definition += " PRIMARY KEY"
+        elif column.not_null:
+            definition += " NOT NULL"
+        if i < len(columns) - 1:
+            definition += ","
+        notes = [note for note in (column.comment, f"joins {column.joins}" if column.joins else None) if note]
+        if notes:
+            definition += f"  -- {'; '.join(notes)}"
+        lines.append(definition)
+    if len(columns) < len(table.columns):
+        lines.append(f"  -- {len(table.columns) - len(columns)} more columns not shown")
+    lines.append(");")
+    return "\n".join(lines)
+
+
+def render(schema: Schema, tables: list, examples: list, terms: set):
+    parts = ["Database schema:"]
+    parts.extend(_render_table(schema.tables[name], terms) for name in tables)
+    others = sorted(name for name in schema.tables if name not in tables)
+    if others:
+        shown = others[:SCHEMA_CONTEXT_MAX_OTHER_TABLES]
+        more = f" and {len(others) - len(shown)} more" if len(others) > len(shown) else ""
+        parts.append(f"Other tables: {', '.join(shown)}{more}")
+    if examples:
+        parts.append("Examples:\n" + "\n".join(
+            f'- Input: "{example.question}"\n  Output: {example.sql}' for example in examples
+        ))
+    return "\n\n".join(parts)
+
+
+async def _introspect(conn):
+    tables = {}
+    for row in await conn.fetch(COLUMNS_QUERY):
+        table = tables.get(row["table_name"])
+        if table is None:
+            table = tables[row["table_name"]] = Table(row["table_name"], [], row["table_comment"])
+        table.columns.append(Column(
+            row["column_name"], row["data_type"], row["not_null"], row["primary_key"], row["column_comment"],
+            terms=_name_terms(row["column_name"]) | _terms(row["column_comment"] or ""),
+        ))
+    columns = {(table.name, column.name): column for table in tables.values() for column in table.columns}
+    for row in await conn.fetch(FOREIGN_KEYS_QUERY):
+        for name, referenced in zip(row["columns"], row["referenced_columns"]):
+            if (row["table_name"], name) in columns:
+                columns[row["table_name"], name].joins = f"{row['referenced_table']}.{referenced}"
+    # Without foreign keys, airport_id joins the table whose single-column primary key is airport_id
+    primary_keys = {}
+    for table in tables.values():
+        keys = [column.name for column in table.columns if column.primary_key]
+        if len(keys) == 1:
+            primary_keys.setdefault(keys[0], table.name)
+    for table in tables.values():
+        for column in table.columns:
+            target = primary_keys.get(column.name)
+            if column.joins is None and not column.primary_key and target and target != table.name:
+                column.joins = f"{target}.{column.name}"
+    for table in tables.values():
+        table.terms = _name_terms(table.name) | _terms(table.comment or "")
+        for column in table.columns:
+            table.terms |= column.terms
+    return Schema(tables)
+
+
+_schema = None
+_schema_version = None
+_lock = asyncio.Lock()
+
+
+async def get_schema(version: str):
+    """The introspected schema, re-read only when the schema version changes."""
+    global _schema, _schema_version
+    start_loading_encoding()
+    if _schema is None or _schema_version != version:
+        async with _lock:
+            if _schema is None or _schema_version != version:
+                with metrics.timed(metrics.SQL_STAGE, "sql.introspect", engine="asyncpg", stage="introspect"):
+                    async with acquire() as conn:
+                        _schema = await _introspect(conn)
+                _schema_version = version
+                logger.info("Schema introspected", extra={"tables": len(_schema.tables), "version": version})
+    return _schema
+
+
+@dataclass
+class SchemaContext:
+    """The part of the prompt describing the database, chosen for one question."""
+    text: str
+    tables: list
+    examples: int
+    tokens: int
+    full_schema_tokens: int
+
+
+async def build(question: str, version: str):
+    """Describe only the tables, columns and examples related to `question`."""
+    schema = await get_schema(version)
+    terms = _terms(question)
+    tables = schema.relevant_tables(terms)
+    examples = schema.relevant_examples(terms, tables)
+    text = render(schema, tables, examples, terms)
+    context = SchemaContext(text, tables, len(examples), count_tokens(text), schema.full_tokens())
+    _stats["requests"] += 1
+    _stats["context_tokens"] += context.tokens
+    _stats["full_schema_tokens"] += context.full_schema_tokens
+    metrics.observe(metrics.PROMPT_CONTEXT_TOKENS, context.tokens, endpoint="sql_query_copilot", context="selected")
+    metrics.observe(
+        metrics.PROMPT_CONTEXT_TOKENS, context.full_schema_tokens, endpoint="sql_query_copilot", context="full"
+    )
+    logger.info(
+        "Schema context",
+        extra={
+            "tables": tables,
+            "examples": context.examples,
+            "context_tokens": context.tokens,
+            "full_schema_tokens": context.full_schema_tokens,
+            "saved_tokens": context.full_schema_tokens - context.tokens,
+        },
+    )
+    return context
+
+
+def context_stats():
+    return {
+        **_stats,
+        "tables": len(_schema.tables) if _schema else 0,
+        "tokenizer": "tiktoken" if _encoding else "estimate",
+    }
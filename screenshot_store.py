@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from PIL import Image
+from starlette.staticfiles import StaticFiles
+
+import metrics
+from app_logging import get_logger
+
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", "static/screenshots")
+SCREENSHOT_URL_PATH = "/static/screenshots"
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "webp").lower()  # webp | jpeg | png
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# Wider screenshots are downscaled to this width, keeping the aspect ratio; 0 keeps the original size
+SCREENSHOT_MAX_WIDTH = int(os.getenv("SCREENSHOT_MAX_WIDTH", "1280"))
+# Retention for files written by the store: oldest go first once the directory is over the size cap
+SCREENSHOT_MAX_AGE = float(os.getenv("SCREENSHOT_MAX_AGE", str(7 * 24 * 3600)))
+SCREENSHOT_MAX_DIR_BYTES = int(os.getenv("SCREENSHOT_MAX_DIR_BYTES", str(200 * 1024 * 1024)))
+SCREENSHOT_EVICT_INTERVAL = float(os.getenv("SCREENSHOT_EVICT_INTERVAL", "60"))
+
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg", "png": "png"}
+# Only content-addressed files are ever evicted; anything else in the directory is left alone
+_STORED_NAME = re.compile(r"^[0-9a-f]{32}\.(webp|jpg|png)$")
+
+logger = get_logger("screenshot_store")
+
+_stats = {"saved": 0, "deduplicated": 0, "evicted": 0}
+_last_evicted_at = 0.0
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-addressed files: a name always maps to the same bytes."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def _encode_options():
+    if SCREENSHOT_FORMAT == "webp":
+        return {"format": "WEBP", "quality": SCREENSHOT_QUALITY, "method": 4}
+    if SCREENSHOT_FORMAT == "jpeg":
+        return {"format": "JPEG", "quality": SCREENSHOT_QUALITY, "optimize": True}
+    if SCREENSHOT_FORMAT == "png":
+        return {"format": "PNG", "optimize": False}
+    raise ValueError(f"Unknown screenshot format: {SCREENSHOT_FORMAT}")
+
+
+def _save(image: Image.Image):
+    """Downscale, hash and encode one screenshot. Blocking; run it off the event loop."""
+    if SCREENSHOT_MAX_WIDTH and image.width > SCREENSHOT_MAX_WIDTH:
+        height = round(image.height * SCREENSHOT_MAX_WIDTH / image.width)
+        image = image.resize((SCREENSHOT_MAX_WIDTH, height), Image.Resampling.LANCZOS)
+    if SCREENSHOT_FORMAT == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    # Hash the pixels (plus encoding settings) so identical pages map to one file
+    # and an existing file is reused without encoding again
+    hasher = hashlib.sha256(f"{image.mode}:{image.size}:{SCREENSHOT_FORMAT}:{SCREENSHOT_QUALITY}".encode())
+    hasher.update(image.tobytes())
+    filename = f"{hasher.hexdigest()[:32]}.{_EXTENSIONS[SCREENSHOT_FORMAT]}"
+    os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+    path = os.path.join(SCREENSHOT_DIR, filename)
+
+    try:
+        # Refresh its age so eviction keeps recently seen screenshots
+        os.utime(path)
+        _stats["deduplicated"] += 1
+        return filename
+    except FileNotFoundError:
+        pass
+    # A temp file of its own, so concurrent saves of the same screenshot never write over each other
+    with tempfile.NamedTemporaryFile(dir=SCREENSHOT_DIR, suffix=".tmp", delete=False) as tmp:
+        try:
+            image.save(tmp, **_encode_options())
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    try:
+        os.replace(tmp.name, path)
+    except FileNotFoundError:
+        if not os.path.exists(path):
+            raise
+        # Another save of the same screenshot got there first
+        _stats["deduplicated"] += 1
+        return filename
+    _stats["saved"] += 1
+    return filename
+
+
+def evict():
+    """Delete stored screenshots older than SCREENSHOT_MAX_AGE, then the oldest until under the size cap."""
+    now = time.time()
+    files = []
+    if not os.path.isdir(SCREENSHOT_DIR):
+        return 0
+    for entry in os.scandir(SCREENSHOT_DIR):
+        if entry.is_file() and _STORED_NAME.match(entry.name):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    evicted = 0
+    for mtime, size, path in files:
+        if now - mtime <= SCREENSHOT_MAX_AGE and total <= SCREENSHOT_MAX_DIR_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    _stats["evicted"] += evicted
+    return evicted
+
+
+async def save(image: Image.Image):
+    """Store a screenshot and return its URL; encoding and eviction run in a worker thread."""
+    global _last_evicted_at
+    with metrics.timed(metrics.BROWSER_STAGE, "screenshot.save", stage="screenshot"):
+        filename = await asyncio.to_thread(_save, image)
+    if time.monotonic() - _last_evicted_at >= SCREENSHOT_EVICT_INTERVAL:
+        _last_evicted_at = time.monotonic()
+        try:
+            await asyncio.to_thread(evict)
+        except OSError as e:
+            logger.warning("Screenshot eviction failed", extra={"error": str(e)})
+    return f"{SCREENSHOT_URL_PATH}/{filename}"
+
+
+def store_stats():
+    return {"format": SCREENSHOT_FORMAT, **_stats}
@@ -0,0 +1,18 @@
+import re
+
+TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or the to what when where which with you your".split()
+)
+
+
+def tokenize(text: str):
+    """Lowercased word tokens with stopwords dropped and plurals folded ("bags" matches "bag")."""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
@@ -0,0 +1,242 @@
+import json
+import os
+import re
+from dataclasses import dataclass
+
+import metrics
+from app_logging import get_logger, truncate
+
+SQL_GUARD_ENABLED = os.getenv("SQL_GUARD_ENABLED", "true").lower() in ("1", "true", "yes")
+# Largest planner cost (EXPLAIN's arbitrary units; a 1M-row table scan is about 20,000) a query may have
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "1000000"))
+# Largest estimated number of rows a query may return or modify
+SQL_GUARD_MAX_ROWS = float(os.getenv("SQL_GUARD_MAX_ROWS", "100000"))
+# Added to SELECTs that have no LIMIT of their own
+SQL_GUARD_DEFAULT_LIMIT = int(os.getenv("SQL_GUARD_DEFAULT_LIMIT", "1000"))
+SQL_GUARD_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_GUARD_STATEMENT_TIMEOUT_MS", "30000"))
+SQL_GUARD_ALLOW_MODIFICATIONS = os.getenv("SQL_GUARD_ALLOW_MODIFICATIONS", "true").lower() in ("1", "true", "yes")
+
+READ_STATEMENTS = {"SELECT", "WITH", "VALUES", "TABLE"}
+MODIFICATION_STATEMENTS = {"INSERT", "UPDATE", "DELETE"}
+# Clauses that already bound (or can't be combined with) an appended LIMIT
+LIMITING_CLAUSES = {"LIMIT", "FETCH", "FOR"}
+
+# Literals, quoted identifiers and comments are skipped so their contents never look like keywords.
+# E'...' strings take backslash escapes; a quote or comment that is never closed can't be skipped
+# safely, so it is matched as `unclosed` and the statement is rejected.
+_TOKEN = re.compile(
+    r"""
+    (?P<skip>--[^\n]*|/\*.*?\*/
+        |[Ee]'(?:[^'\\]|\\.|'')*'
+        |'(?:[^']|'')*'
+        |"(?:[^"]|"")*"
+        |\$(?P<tag>(?:[A-Za-z_][A-Za-z_0-9]*)?)\$.*?\$(?P=tag)\$)
+    |(?P<unclosed>[Ee]?'|"|/\*|\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$)
+    |(?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<semicolon>;)
+    """,
+    re.S | re.X,
+)
+
+logger = get_logger("sql_guardrails")
+
+_stats = {"checked": 0, "limits_added": 0, "rejected": 0}
+
+
+class QueryRejected(Exception):
+    """A generated query the guardrails refused to run; `reason` labels the rejection metric."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class GuardedQuery:
+    sql: str
+    modifies: bool
+    limit_added: bool = False
+    cost: float = None
+    rows: float = None
+    # The plan check was answered from the caller's cache instead of an EXPLAIN
+    plan_cached: bool = False
+
+
+def _scan(sql: str):
+    """(top-level words, every word, end of the statement) for one statement; raises on several."""
+    depth = 0
+    top_level = []
+    words = []
+    end = len(sql)
+    for match in _TOKEN.finditer(sql):
+        if match.group("unclosed"):
+            raise QueryRejected("syntax", "The query has an unterminated quoted string, identifier or comment.")
+        if match.group("semicolon"):
+            end = match.start()
+            break
+        if match.group("word"):
+            word = match.group("word").upper()
+            words.append(word)
+            if depth == 0:
+                top_level.append(word)
+        elif match.group("open"):
+            depth += 1
+        elif match.group("close"):
+            depth -= 1
+    # Anything but comments and semicolons after the first statement is a second one
+    rest = _TOKEN.sub(lambda match: " " if match.group("skip") else match.group(), sql[end:])
+    if rest.strip(" \t\r\n;"):
+        raise QueryRejected("multiple_statements", "Only one SQL statement can be run at a time.")
+    return top_level, words, end
+
+
+def check_single_statement_text(query: GuardedQuery):
+    """Reject any semicolon left in the statement, even inside a literal or comment.
+
+    psycopg2 sends queries through the simple query protocol, where Postgres runs
+    every statement in the text; without a semicolon there can only be one.
+    """
+    if ";" in query.sql:
+        raise QueryRejected(
+            "multiple_statements", "Semicolons inside literals or comments are not supported; rewrite the query without them."
+        )
+
+
+def _locks_rows(words: list):
+    """Whether a statement has a FOR UPDATE / NO KEY UPDATE / SHARE / KEY SHARE row-locking clause anywhere."""
+    return any(
+        word == "FOR" and following in ("UPDATE", "SHARE", "NO", "KEY")
+        for word, following in zip(words, words[1:])
+    )
+
+
+def _modifies(words: list):
+    """Whether a statement writes, counting data-modifying CTEs but not FOR UPDATE locking clauses."""
+    for i, word in enumerate(words):
+        if word in MODIFICATION_STATEMENTS and (i == 0 or words[i - 1] not in ("FOR", "KEY")):
+            return True
+    return False
+
+
+def review(sql: str, limit: int = SQL_GUARD_DEFAULT_LIMIT):
+    """Classify a generated statement and add a LIMIT to unbounded reads; raises QueryRejected.
+
+    Only single SELECT/WITH/VALUES/TABLE statements, and INSERT/UPDATE/DELETE
+    when modifications are allowed, get through.
+    """
+    top_level, words, end = _scan(sql)
+    kind = top_level[0] if top_level else ""
+    modifies = kind in MODIFICATION_STATEMENTS or (kind == "WITH" and _modifies(words))
+    if kind not in READ_STATEMENTS and kind not in MODIFICATION_STATEMENTS:
+        raise QueryRejected("statement_type", f"{kind or 'Empty'} statements are not allowed; only queries can be run.")
+    if modifies and not SQL_GUARD_ALLOW_MODIFICATIONS:
+        raise QueryRejected("statement_type", "Only read-only queries can be run.")
+    if not modifies and _locks_rows(words):
+        # Reads run in a read-only transaction, where Postgres refuses to lock rows
+        raise QueryRejected("row_locking", "Row-locking clauses (FOR UPDATE, FOR SHARE) can't be used in queries.")
+    statement = sql[:end].rstrip()
+    if modifies or LIMITING_CLAUSES & set(top_level):
+        return GuardedQuery(statement, modifies)
+    return GuardedQuery(f"{statement}\nLIMIT {limit}", modifies, limit_added=True)
+
+
+def _estimated_rows(plan: dict):
+    if plan.get("Node Type") == "ModifyTable" and plan.get("Plans"):
+        # Without RETURNING the top node reports no rows; the rows it writes come from below
+        return plan["Plans"][0]["Plan Rows"]
+    return plan["Plan Rows"]
+
+
+def check_plan(query: GuardedQuery, explain_output):
+    """Reject the query if EXPLAIN (FORMAT JSON) estimates it above the cost or row limits."""
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    plan = explain_output[0]["Plan"]
+    query.cost = plan["Total Cost"]
+    query.rows = _estimated_rows(plan)
+    if query.cost > SQL_GUARD_MAX_COST:
+        raise QueryRejected(
+            "cost",
+            f"The query is too expensive to run (estimated cost {query.cost:,.0f}, limit {SQL_GUARD_MAX_COST:,.0f}); "
+            "add filters, join conditions or an aggregate.",
+        )
+    if query.rows > SQL_GUARD_MAX_ROWS:
+        action = "modify" if query.modifies else "return"
+        raise QueryRejected(
+            "rows",
+            f"The query would {action} too many rows (estimated {query.rows:,.0f}, limit {SQL_GUARD_MAX_ROWS:,.0f}); "
+            "narrow it with a WHERE clause.",
+        )
+
+
+def transaction_settings(query: GuardedQuery):
+    """Statements to run first in the query's transaction, as one string so they take one round trip."""
+    settings = [f"SET LOCAL statement_timeout = {SQL_GUARD_STATEMENT_TIMEOUT_MS}"]
+    if not query.modifies:
+        settings.insert(0, "SET TRANSACTION READ ONLY")
+    return "; ".join(settings)
+
+
+def explain_sql(query: GuardedQuery):
+    return f"EXPLAIN (FORMAT JSON) {query.sql}"
+
+
+def rejected(engine: str, sql: str, error: QueryRejected):
+    _stats["rejected"] += 1
+    metrics.inc(metrics.SQL_GUARDRAIL_REJECTIONS, engine=engine, reason=error.reason)
+    logger.warning("SQL query rejected", extra={"engine": engine, "reason": error.reason, "sql": truncate(sql)})
+
+
+def passed(engine: str, query: GuardedQuery):
+    _stats["checked"] += 1
+    if query.limit_added:
+        _stats["limits_added"] += 1
+        metrics.inc(metrics.SQL_GUARDRAIL_LIMITS_ADDED, engine=engine)
+    logger.debug(
+        "SQL query passed guardrails",
+        extra={"engine": engine, "cost": query.cost, "rows": query.rows, "limit_added": query.limit_added},
+    )
+
+
+async def guard(
+    conn, sql: str, limit: int = SQL_GUARD_DEFAULT_LIMIT, engine: str = "asyncpg", plans=None, scope=None
+):
+    """Review and EXPLAIN a query on an asyncpg connection that is already in a transaction.
+
+    Sets the transaction read-only for queries that don't modify anything and
+    bounds every statement in it with the statement timeout. `plans` is an
+    optional cache backend of plans that already passed, keyed by (scope, SQL);
+    those statements skip the EXPLAIN. Returns the GuardedQuery to run, or
+    raises QueryRejected.
+    """
+    if not SQL_GUARD_ENABLED:
+        return GuardedQuery(sql, sql.strip().upper().startswith(tuple(MODIFICATION_STATEMENTS)))
+    try:
+        query = review(sql, limit)
+        await conn.execute(transaction_settings(query))
+        plan = await plans.get((scope, query.sql)) if plans is not None else None
+        if plan is not None:
+            query.cost, query.rows, query.plan_cached = plan["cost"], plan["rows"], True
+        else:
+            with metrics.timed(metrics.SQL_STAGE, "sql.explain", engine=engine, stage="explain"):
+                check_plan(query, await conn.fetchval(explain_sql(query)))
+            if plans is not None:
+                await plans.set((scope, query.sql), None, {"cost": query.cost, "rows": query.rows})
+    except QueryRejected as e:
+        rejected(engine, sql, e)
+        raise
+    passed(engine, query)
+    return query
+
+
+def guardrail_stats():
+    return {
+        **_stats,
+        "enabled": SQL_GUARD_ENABLED,
+        "max_cost": SQL_GUARD_MAX_COST,
+        "max_rows": SQL_GUARD_MAX_ROWS,
+        "default_limit": SQL_GUARD_DEFAULT_LIMIT,
+        "statement_timeout_ms": SQL_GUARD_STATEMENT_TIMEOUT_MS,
+    }
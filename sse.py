@@ -0,0 +1,60 @@
+import json
+from dataclasses import dataclass
+
+
+@dataclass
+class StreamEvent:
+    """One frame of a streamed response.
+
+    `event` is one of "token" (text to append to the answer), "tool_call",
+    "tool_result", "status", "truncated", "error" or "done". "cache_control" events are
+    read by the response cache and never sent to the client.
+    """
+    event: str
+    data: str = ""
+
+
+def token(text: str):
+    return StreamEvent("token", text)
+
+
+def tool_call(name: str, arguments):
+    return StreamEvent("tool_call", json.dumps({"name": name, "arguments": arguments}, default=str))
+
+
+def tool_result(name: str, output, limit: int = 500):
+    output = str(output)
+    if len(output) > limit:
+        output = output[:limit] + "..."
+    return StreamEvent("tool_result", json.dumps({"name": name, "output": output}))
+
+
+def status(text: str):
+    return StreamEvent("status", text)
+
+
+def truncated(rows: int, size: int):
+    """Mark the answer as cut short after `rows` rows / `size` bytes."""
+    return StreamEvent("truncated", json.dumps({"rows": rows, "bytes": size}))
+
+
+def no_store():
+    """Mark the current response as not cacheable, e.g. because it modified data."""
+    return StreamEvent("cache_control", "no-store")
+
+
+def format_sse(event: StreamEvent):
+    """Encode an event as a text/event-stream frame; multi-line data becomes several data: lines."""
+    data_lines = "".join(f"data: {line}\n" for line in event.data.split("\n"))
+    return f"event: {event.event}\n{data_lines}\n"
+
+
+async def sse_stream(events):
+    """Format an async iterator of StreamEvents as SSE, ending with an error frame on failure and a done frame."""
+    try:
+        async for event in events:
+            if event.event != "cache_control":
+                yield format_sse(event)
+    except Exception as e:
+        yield format_sse(StreamEvent("error", str(e)))
+    yield format_sse(StreamEvent("done"))
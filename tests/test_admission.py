@@ -0,0 +1,177 @@
+import asyncio
+import types
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import AdmittedStreamingResponse, _Gate
+
+
+def rejection(coro):
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(coro)
+    return excinfo.value
+
+
+def test_full_queue_is_rejected_with_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "RETRY_AFTER", 7)
+
+    async def scenario():
+        gate = _Gate("llm", concurrency=1, queue_size=1)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+        try:
+            await gate.acquire()
+        finally:
+            waiter.cancel()
+            assert gate.rejected == {"queue_full": 1}
+
+    error = rejection(scenario())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+
+
+def test_queued_request_times_out(monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.01)
+    gate = _Gate("llm", concurrency=1, queue_size=4)
+
+    async def scenario():
+        await gate.acquire()
+        await gate.acquire()
+
+    error = rejection(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert gate.rejected == {"queue_timeout": 1}
+    assert (gate.active, gate.waiting) == (1, 0)
+
+
+def test_queued_request_gets_the_released_slot():
+    async def scenario():
+        gate = _Gate("llm", concurrency=1, queue_size=1)
+        ticket = await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        ticket.release()
+        await waiter
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert (gate.active, gate.waiting, gate.admitted) == (1, 0, 2)
+
+
+def test_ticket_release_is_idempotent():
+    async def scenario():
+        gate = _Gate("llm", concurrency=2, queue_size=0)
+        ticket = await gate.acquire()
+        ticket.release()
+        ticket.release()
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert gate.active == 0
+    # A second release would have given the semaphore a third slot
+    assert gate.slots._value == 2
+
+
+def test_rate_limit_token_bucket(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(admission, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(admission, "RATE_LIMIT_PER_MINUTE", 6)
+    monkeypatch.setattr(admission, "RATE_LIMIT_BURST", 2)
+    monkeypatch.setattr(admission, "_buckets", admission.OrderedDict())
+    monkeypatch.setattr(admission, "_rate_limited", admission.Counter())
+
+    admission._check_rate_limit("llm", "alice")
+    admission._check_rate_limit("llm", "alice")
+    with pytest.raises(HTTPException) as excinfo:
+        admission._check_rate_limit("llm", "alice")
+    assert excinfo.value.status_code == 429
+    # One token every 10 seconds
+    assert excinfo.value.headers == {"Retry-After": "10"}
+    assert admission._rate_limited["llm"] == 1
+
+    # Other clients have their own bucket
+    admission._check_rate_limit("llm", "bob")
+    clock.now += 10
+    admission._check_rate_limit("llm", "alice")
+
+
+def test_rate_limit_forgets_idle_clients(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_PER_MINUTE", 6)
+    monkeypatch.setattr(admission, "RATE_LIMIT_MAX_CLIENTS", 2)
+    monkeypatch.setattr(admission, "_buckets", admission.OrderedDict())
+    for client in ("alice", "bob", "alice", "carol"):
+        admission._check_rate_limit("llm", client)
+    assert list(admission._buckets) == ["alice", "carol"]
+
+
+SCOPE = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+         "method": "GET", "path": "/", "headers": []}
+
+
+async def _receive():
+    await asyncio.Event().wait()
+
+
+async def _send(message):
+    pass
+
+
+def test_stream_releases_its_ticket_when_finished():
+    async def scenario():
+        gate = _Gate("llm", concurrency=1, queue_size=0)
+
+        async def body():
+            yield "data: 1\n\n"
+            yield "data: 2\n\n"
+
+        response = AdmittedStreamingResponse(await gate.acquire(), body(), media_type="text/event-stream")
+        await response(SCOPE, _receive, _send)
+        assert gate.active == 0
+        # The slot can be taken again without queueing
+        await asyncio.wait_for(gate.acquire(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_stream_releases_its_ticket_when_cancelled():
+    async def scenario():
+        gate = _Gate("llm", concurrency=1, queue_size=0)
+        started = asyncio.Event()
+
+        async def body():
+            yield "data: 1\n\n"
+            started.set()
+            await asyncio.Event().wait()
+
+        response = AdmittedStreamingResponse(await gate.acquire(), body(), media_type="text/event-stream")
+        task = asyncio.create_task(response(SCOPE, _receive, _send))
+        await started.wait()
+        assert gate.active == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert gate.active == 0
+        await asyncio.wait_for(gate.acquire(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_stream_releases_its_ticket_when_the_body_fails():
+    async def scenario():
+        gate = _Gate("llm", concurrency=1, queue_size=0)
+
+        async def body():
+            yield "data: 1\n\n"
+            raise RuntimeError("run failed")
+
+        response = AdmittedStreamingResponse(await gate.acquire(), body(), media_type="text/event-stream")
+        with pytest.raises(RuntimeError):
+            await response(SCOPE, _receive, _send)
+        assert gate.active == 0
+
+    asyncio.run(scenario())
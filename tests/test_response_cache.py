@@ -0,0 +1,198 @@
+import asyncio
+import types
+
+import pytest
+
+import response_cache
+import sse
+from response_cache import MemoryCacheBackend, SQLiteCacheBackend, normalize_prompt
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make(**limits):
+        limits = {"max_entries": 100, "max_bytes": 10**6, "ttl": 0, **limits}
+        if request.param == "sqlite":
+            return SQLiteCacheBackend(path=str(tmp_path / "responses.sqlite3"), **limits)
+        return MemoryCacheBackend(**limits)
+    return make
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """The module-level cache, enabled, on a fresh memory backend and without the embedding tier."""
+    backend = MemoryCacheBackend(max_entries=100, max_bytes=10**6, ttl=0)
+    monkeypatch.setattr(response_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(response_cache, "EMBEDDING_MODEL", None)
+    monkeypatch.setattr(response_cache, "_backend", backend)
+    monkeypatch.setattr(response_cache, "_counters", {})
+    return backend
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  What is the  baggage\nallowance?? ") == "what is the baggage allowance"
+    assert normalize_prompt("Hello.") == normalize_prompt("hello")
+    assert normalize_prompt("a b") != normalize_prompt("ab")
+
+
+def test_lookup_key_is_scoped_to_endpoint_and_model(cache):
+    def key(endpoint, prompt, model):
+        return asyncio.run(response_cache.lookup(endpoint, prompt, model)).key
+
+    assert key("llm", "Hello World?", "gpt") == key("llm", "  hello   world", "gpt")
+    assert key("llm", "hello", "gpt") != key("llm", "hello", "other-model")
+    assert key("llm", "hello", "gpt") != key("airline_info", "hello", "gpt")
+
+
+def test_ttl_expiry(make_backend, clock):
+    backend = make_backend(ttl=10)
+    asyncio.run(backend.set("a", "scope", {"answer": "x"}))
+    clock.now += 5
+    assert asyncio.run(backend.get("a")) == {"answer": "x"}
+    clock.now += 6
+    assert asyncio.run(backend.get("a")) is None
+
+
+def test_least_recently_used_entry_is_evicted(make_backend, clock):
+    backend = make_backend(max_entries=2)
+
+    async def scenario():
+        await backend.set("a", "scope", {"answer": "a"})
+        clock.now += 1
+        await backend.set("b", "scope", {"answer": "b"})
+        clock.now += 1
+        await backend.get("a")
+        clock.now += 1
+        await backend.set("c", "scope", {"answer": "c"})
+        return [await backend.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [True, False, True]
+    assert backend.stats()["evictions"] == 1
+
+
+def test_size_limit_evicts_oldest(make_backend, clock):
+    entry_size = len('{"answer": "' + "x" * 100 + '"}')
+    backend = make_backend(max_bytes=entry_size * 2)
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await backend.set(key, "scope", {"answer": "x" * 100})
+            clock.now += 1
+        return [await backend.get(key) is not None for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [False, True, True]
+    assert backend.stats()["bytes"] <= entry_size * 2
+
+
+def test_replacing_a_key_keeps_one_entry(make_backend, clock):
+    backend = make_backend()
+    asyncio.run(backend.set("a", "scope", {"answer": "old"}))
+    asyncio.run(backend.set("a", "scope", {"answer": "new"}))
+    assert asyncio.run(backend.get("a")) == {"answer": "new"}
+    assert backend.stats()["entries"] == 1
+
+
+async def _events(*events, fail: bool = False):
+    for event in events:
+        yield event
+    if fail:
+        raise RuntimeError("run failed")
+
+
+async def _drain(events):
+    return [event async for event in events]
+
+
+def _record(cache_lookup, events):
+    return asyncio.run(_drain(response_cache.record(cache_lookup, events)))
+
+
+def test_completed_stream_is_stored_and_replayed(cache):
+    cache_lookup = asyncio.run(response_cache.lookup("sql_query_copilot", "Show delays", "gpt"))
+    _record(cache_lookup, _events(sse.tool_call("generate_sql", {}), sse.token("a"), sse.token("b"), sse.truncated(2, 10)))
+
+    hit = asyncio.run(response_cache.lookup("sql_query_copilot", "show delays?", "gpt"))
+    assert (hit.answer, hit.tier) == ("ab", "exact")
+    replayed = asyncio.run(_drain(response_cache.replay(hit.answer, hit.truncated)))
+    assert [(event.event, event.data) for event in replayed] == [
+        ("token", "ab"), ("truncated", sse.truncated(2, 10).data)
+    ]
+
+
+def test_no_store_response_is_not_recorded(cache):
+    cache_lookup = asyncio.run(response_cache.lookup("sql_query", "Delete pilots", "gpt"))
+    events = _record(cache_lookup, _events(sse.token("done"), sse.no_store()))
+    # The marker is passed through for the SSE layer to drop
+    assert [event.event for event in events] == ["token", "cache_control"]
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_stream_is_not_recorded(cache):
+    cache_lookup = asyncio.run(response_cache.lookup("llm", "Hello", "gpt"))
+    with pytest.raises(RuntimeError):
+        _record(cache_lookup, _events(sse.token("partial"), fail=True))
+    assert cache.stats()["entries"] == 0
+
+
+def test_abandoned_stream_is_not_recorded(cache):
+    cache_lookup = asyncio.run(response_cache.lookup("llm", "Hello", "gpt"))
+
+    async def consume_first_event():
+        events = response_cache.record(cache_lookup, _events(sse.token("partial"), sse.token("rest")))
+        await events.__anext__()
+        # What the response does when the client goes away
+        await events.aclose()
+
+    asyncio.run(consume_first_event())
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_without_tokens_is_not_recorded(cache):
+    cache_lookup = asyncio.run(response_cache.lookup("llm", "Hello", "gpt"))
+    _record(cache_lookup, _events(sse.status("working")))
+    assert cache.stats()["entries"] == 0
+
+
+def test_disabled_cache_neither_hits_nor_stores(cache, monkeypatch):
+    cache_lookup = asyncio.run(response_cache.lookup("llm", "Hello", "gpt"))
+    _record(cache_lookup, _events(sse.token("hi")))
+    monkeypatch.setattr(response_cache, "CACHE_ENABLED", False)
+    assert asyncio.run(response_cache.lookup("llm", "Hello", "gpt")).answer is None
+    _record(cache_lookup, _events(sse.token("other")))
+    assert cache.stats()["entries"] == 1
+
+
+def test_lookups_and_stores_are_counted(cache, monkeypatch):
+    monkeypatch.setattr(response_cache.metrics, "METRICS_ENABLED", True)
+
+    def count(counter, **labels):
+        return counter.labels(**labels)._value.get()
+
+    lookups = response_cache.metrics.RESPONSE_CACHE_LOOKUPS
+    stores = response_cache.metrics.RESPONSE_CACHE_STORES
+    before = (count(lookups, endpoint="llm", result="miss"), count(lookups, endpoint="llm", result="exact_hit"),
+              count(stores, endpoint="llm"))
+
+    cache_lookup = asyncio.run(response_cache.lookup("llm", "Hello", "gpt"))
+    _record(cache_lookup, _events(sse.token("hi")))
+    asyncio.run(response_cache.lookup("llm", "hello", "gpt"))
+
+    after = (count(lookups, endpoint="llm", result="miss"), count(lookups, endpoint="llm", result="exact_hit"),
+             count(stores, endpoint="llm"))
+    assert [b - a for a, b in zip(before, after)] == [1, 1, 1]
+    assert response_cache.cache_stats()["endpoints"]["llm"] == {"exact_hits": 1, "semantic_hits": 0, "misses": 1, "stores": 1}
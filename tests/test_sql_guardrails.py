@@ -0,0 +1,141 @@
+import pytest
+
+import sql_guardrails
+from sql_guardrails import QueryRejected, check_plan, check_single_statement_text, review
+
+
+def rejection(sql: str):
+    with pytest.raises(QueryRejected) as excinfo:
+        review(sql)
+    return excinfo.value.reason
+
+
+def test_unbounded_select_gets_limit():
+    query = review("SELECT * FROM pilots", limit=50)
+    assert query.sql == "SELECT * FROM pilots\nLIMIT 50"
+    assert query.limit_added
+    assert not query.modifies
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM pilots LIMIT 5",
+    "SELECT * FROM pilots ORDER BY pilot_id FETCH FIRST 5 ROWS ONLY",
+])
+def test_bounded_select_is_unchanged(sql):
+    query = review(sql)
+    assert query.sql == sql
+    assert not query.limit_added
+
+
+def test_limit_in_subquery_does_not_bound_outer_query():
+    query = review("SELECT * FROM (SELECT * FROM pilots LIMIT 5) p, airports")
+    assert query.limit_added
+
+
+def test_trailing_semicolon_and_comment_are_dropped():
+    query = review("SELECT 1; -- done\n")
+    assert query.sql == "SELECT 1\nLIMIT 1000"
+
+
+def test_modifications_get_no_limit():
+    query = review("UPDATE pilots SET pilot_name = 'x' WHERE pilot_id = 1")
+    assert query.modifies
+    assert not query.limit_added
+
+
+def test_data_modifying_cte_counts_as_modification():
+    query = review("WITH gone AS (DELETE FROM flight_delays RETURNING *) SELECT count(*) FROM gone")
+    assert query.modifies
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM pilots FOR UPDATE",
+    "SELECT * FROM pilots LIMIT 5 FOR SHARE",
+    "SELECT * FROM pilots FOR NO KEY UPDATE",
+    "WITH p AS (SELECT * FROM pilots FOR KEY SHARE) SELECT * FROM p",
+])
+def test_row_locking_reads_are_rejected(sql):
+    # They would run in a read-only transaction, which can't lock rows
+    assert rejection(sql) == "row_locking"
+
+
+def test_row_locking_subquery_in_modification_is_allowed():
+    query = review("UPDATE pilots SET pilot_name = 'x' WHERE pilot_id IN (SELECT pilot_id FROM pilots FOR UPDATE)")
+    assert query.modifies
+
+
+def test_modifications_rejected_when_disabled(monkeypatch):
+    monkeypatch.setattr(sql_guardrails, "SQL_GUARD_ALLOW_MODIFICATIONS", False)
+    assert rejection("DELETE FROM pilots") == "statement_type"
+    assert rejection("WITH d AS (DELETE FROM pilots RETURNING *) SELECT * FROM d") == "statement_type"
+
+
+@pytest.mark.parametrize("sql", ["DROP TABLE pilots", "COPY pilots TO '/tmp/x'", "", "-- nothing"])
+def test_other_statements_are_rejected(sql):
+    assert rejection(sql) == "statement_type"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; DROP TABLE pilots",
+    "SELECT 1; /* c */ DELETE FROM pilots;",
+    # The escaped quote doesn't end the E'' string, so the statement ends at the first semicolon
+    "UPDATE pilots SET email = E'\\'' WHERE false; DROP TABLE pilots; SELECT '1",
+])
+def test_multiple_statements_are_rejected(sql):
+    assert rejection(sql) == "multiple_statements"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 'a;b' FROM pilots",
+    "SELECT E'it\\'s; fine' FROM pilots",
+    "SELECT \"odd;name\" FROM pilots",
+    "SELECT $body$ ; $body$",
+    "SELECT 1 /* ; */",
+])
+def test_semicolons_inside_literals_and_comments(sql):
+    query = review(sql)
+    assert query.sql.startswith(sql)
+    # ...but are refused where the text goes through psycopg2's simple query protocol
+    with pytest.raises(QueryRejected):
+        check_single_statement_text(query)
+
+
+def test_keywords_inside_literals_are_ignored():
+    query = review("SELECT 'DELETE FROM pilots LIMIT 1' AS text")
+    assert not query.modifies
+    assert query.limit_added
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 'abc",
+    "SELECT E'abc\\'",
+    "SELECT \"abc",
+    "SELECT 1 /* abc",
+    "SELECT $tag$ abc",
+])
+def test_unterminated_literals_are_rejected(sql):
+    assert rejection(sql) == "syntax"
+
+
+def test_positional_parameter_is_not_a_dollar_quote():
+    assert review("SELECT $1").sql == "SELECT $1\nLIMIT 1000"
+
+
+def test_check_plan_limits(monkeypatch):
+    monkeypatch.setattr(sql_guardrails, "SQL_GUARD_MAX_COST", 1000)
+    monkeypatch.setattr(sql_guardrails, "SQL_GUARD_MAX_ROWS", 100)
+    query = review("SELECT * FROM pilots")
+    check_plan(query, '[{"Plan": {"Node Type": "Seq Scan", "Total Cost": 10.5, "Plan Rows": 20}}]')
+    assert (query.cost, query.rows) == (10.5, 20)
+    with pytest.raises(QueryRejected) as excinfo:
+        check_plan(query, [{"Plan": {"Node Type": "Seq Scan", "Total Cost": 5000, "Plan Rows": 20}}])
+    assert excinfo.value.reason == "cost"
+
+
+def test_check_plan_counts_rows_a_modification_writes(monkeypatch):
+    monkeypatch.setattr(sql_guardrails, "SQL_GUARD_MAX_ROWS", 100)
+    query = review("DELETE FROM flight_delays")
+    plan = {"Node Type": "ModifyTable", "Total Cost": 10, "Plan Rows": 0, "Plans": [{"Plan Rows": 500}]}
+    with pytest.raises(QueryRejected) as excinfo:
+        check_plan(query, [{"Plan": plan}])
+    assert excinfo.value.reason == "rows"
@@ -1,129 +1,139 @@
 import asyncio
 import os
-from datetime import datetime
-from pathlib import Path
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
 from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_agentchat.messages import TextMessage, MultiModalMessage
+from autogen_agentchat.messages import TextMessage, MultiModalMessage, ToolCallRequestEvent
 from autogen_core.models import ModelFamily
-from autogen_core import Image
+from autogen_core import CancellationToken, Image
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_ext.agents.web_surfer import MultimodalWebSurfer
-from openai import AsyncOpenAI
-# Environment variables are loaded from the system environment
 
-async def run_web_surfer(user_message: str):
-    model_client = OpenAIChatCompletionClient(
-        base_url=os.getenv("BASE_URL_EXTERNAL"), # omit for OpenAI calls
-        model=os.getenv("LLM_MODEL_EXTERNAL"),
-        api_key=os.getenv("API_KEY_EXTERNAL"),
-        model_info={
-            "vision": False,
-            "function_calling": True,
-            "json_output": True,
-            "family": ModelFamily.GPT_4O,
-        }
-    )
-    
-    assistant = AssistantAgent("assistant", model_client, system_message="You are a helpful assistant that can provide information to the user based on web searches conducted by the Web Surfer agent.")
-    web_surfer = MultimodalWebSurfer("web_surfer", model_client=model_client, headless=True)
-    user_proxy = UserProxyAgent("user_proxy")
-    #termination = TextMentionTermination("exit") # Type 'exit' to end the conversation.
-    termination =  MaxMessageTermination(6) | TextMentionTermination("TERMINATE")
-    team = RoundRobinGroupChat([web_surfer, assistant], termination_condition=termination)
-    # await Console(team.run_stream(task="Find information about current weather in St. Charles, MO, and write a short summary."))
-    stream = team.run_stream(task=user_message)
-    results = []
-    image_paths = []
+import browser_pool
+import disconnect
+import metrics
+import screenshot_store
+import sse
+from app_logging import digest, get_logger, truncate
+from llm_clients import get_http_client, get_model_name
+from message_selector import select_message
+# Environment variables are loaded from the system environment
 
-    # Create screenshots directory if it doesn't exist
-    screenshots_dir = Path("static/screenshots")
-    screenshots_dir.mkdir(parents=True, exist_ok=True)
-
-    async for message in stream:
-        # handle any streamed message that exposes a 'content' attribute
-        content = getattr(message, "content", None)
-        if content is not None:
-            print(type(message))
-            print("--Begin message--")
-            print(content)
-            print("--End message--")
-
-            # Collect TextMessage types
-            if isinstance(message, TextMessage):
-                results.append(content)
-
-            # Handle MultiModalMessage with images
-            elif isinstance(message, MultiModalMessage):
-                text_parts = []
-                for item in content:
-                    if isinstance(item, str):
-                        text_parts.append(item)
-                    elif isinstance(item, Image):
-                        # Save the image to static/screenshots
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-                        image_filename = f"screenshot_{timestamp}.png"
-                        image_path = screenshots_dir / image_filename
-
-                        # Save the image using PIL (access the PIL Image via .image attribute)
-                        pil_image = item.image
-                        pil_image.save(str(image_path))
-
-                        # Store the web-accessible path
-                        web_path = f"/static/screenshots/{image_filename}"
-                        image_paths.append(web_path)
-                        print(f"Saved screenshot to: {image_path}")
-
-                # Add text content to results if any
-                if text_parts:
-                    results.append(" ".join(text_parts))
-
-    # If we have collected TextMessages, use LLM to select the one with bullet points
-    if results:
-        # Create a prompt with all numbered messages
-        messages_text = ""
-        for i, msg in enumerate(results, 1):
-            messages_text += f"\n\n---MESSAGE {i}---\n{msg}"
+logger = get_logger("web_surfer")
+
+# Page the surfer opens first (MultimodalWebSurfer defaults to Bing)
+START_PAGE = os.getenv("WEB_SURFER_START_PAGE") or MultimodalWebSurfer.DEFAULT_START_PAGE
+
+_model_client = None
+
+
+def get_model_client():
+    """Return the shared AutoGen model client, backed by the EXTERNAL profile's connection pool."""
+    global _model_client
+    if _model_client is None:
+        _model_client = OpenAIChatCompletionClient(
+            base_url=os.getenv("BASE_URL_EXTERNAL"), # omit for OpenAI calls
+            model=get_model_name("EXTERNAL"),
+            api_key=os.getenv("API_KEY_EXTERNAL"),
+            http_client=get_http_client("EXTERNAL"),
+            model_info={
+                "vision": False,
+                "function_calling": True,
+                "json_output": True,
+                "family": ModelFamily.GPT_4O,
+            }
+        )
+    return _model_client
 
-        prompt = f"""You have received multiple messages below. Please identify and return ONLY the message that is formatted with bullet points. If multiple messages have bullet points, choose the most comprehensive one. If no messages have bullet points, return the most detailed message.
 
-Return ONLY the exact content of the selected message, with no additional commentary, explanations, or modifications.
+async def run_web_surfer(user_message: str):
+    model_client = get_model_client()
 
-Here are the messages:{messages_text}"""
+    results = []
+    image_paths = []
 
-        # Use LLM to select the best message
-        llm_client = AsyncOpenAI(
-            api_key=os.getenv("API_KEY_LOCAL"),
-            base_url=os.getenv("BASE_URL_LOCAL")
+    async with browser_pool.checkout() as (playwright, context):
+        assistant = AssistantAgent("assistant", model_client, system_message="You are a helpful assistant that can provide information to the user based on web searches conducted by the Web Surfer agent.")
+        # The browser belongs to the pool: the surfer only opens a page in the
+        # borrowed context and must not close() it
+        web_surfer = MultimodalWebSurfer(
+            "web_surfer", model_client=model_client, headless=True, playwright=playwright, context=context,
+            start_page=START_PAGE,
         )
-
-        response = await llm_client.chat.completions.create(
-            model=os.getenv("LLM_MODEL_LOCAL"),
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that selects the best formatted message."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
+        user_proxy = UserProxyAgent("user_proxy")
+        #termination = TextMentionTermination("exit") # Type 'exit' to end the conversation.
+        termination =  MaxMessageTermination(6) | TextMentionTermination("TERMINATE")
+        team = RoundRobinGroupChat([web_surfer, assistant], termination_condition=termination)
+        # await Console(team.run_stream(task="Find information about current weather in St. Charles, MO, and write a short summary."))
+        # The team waits for its agents to go idle when stopped; the token makes them stop now
+        cancellation_token = CancellationToken()
+        disconnect.on_cancel(cancellation_token.cancel, "browser_session")
+        stream = team.run_stream(task=user_message, cancellation_token=cancellation_token)
+        async for message in stream:
+            # handle any streamed message that exposes a 'content' attribute
+            usage = getattr(message, "models_usage", None)
+            if usage is not None:
+                metrics.record_tokens("EXTERNAL", get_model_name("EXTERNAL"), usage.prompt_tokens, usage.completion_tokens)
+            content = getattr(message, "content", None)
+            if content is not None:
+                logger.debug(
+                    "Agent message",
+                    extra={"type": type(message).__name__, "source": message.source, "content": truncate(content)},
+                )
+
+                # Collect TextMessage types
+                # (the user's own task is never the answer)
+                if isinstance(message, TextMessage):
+                    if message.source != "user":
+                        results.append(content)
+                        yield sse.status(f"{message.source}: {content}")
+
+                elif isinstance(message, ToolCallRequestEvent):
+                    for call in content:
+                        yield sse.tool_call(call.name, call.arguments)
+
+                # Handle MultiModalMessage with images
+                elif isinstance(message, MultiModalMessage):
+                    text_parts = []
+                    for item in content:
+                        if isinstance(item, str):
+                            text_parts.append(item)
+                        elif isinstance(item, Image):
+                            # Encoded off the event loop; identical pages share one file
+                            # (access the PIL Image via .image attribute)
+                            web_path = await screenshot_store.save(item.image)
+                            if web_path not in image_paths:
+                                image_paths.append(web_path)
+                            logger.debug("Saved screenshot", extra={"path": web_path, "size": item.image.size})
+
+                    # Add text content to results if any
+                    if text_parts:
+                        results.append(" ".join(text_parts))
+                        yield sse.status(f"{message.source}: {' '.join(text_parts)}")
+
+    # If we have collected TextMessages, select the one with bullet points;
+    # the LLM is only consulted when the local scorer can't tell
+    if results:
+        selected_message, method = await select_message(results)
+        logger.info(
+            "Selected message",
+            extra={"method": method, "selected": truncate(selected_message), "selected_sha256": digest(selected_message)},
         )
 
-        selected_message = response.choices[0].message.content
-        print("\n\n===SELECTED MESSAGE (with bullet points)===")
-        print(selected_message)
-        print("===END SELECTED MESSAGE===\n")
-
         # If we have images, append them as HTML img tags
         if image_paths:
             image_html = "\n\n" + "\n".join([f'<img src="{path}" style="max-width: 100%; margin: 10px 0;">' for path in image_paths])
             selected_message += image_html
 
-        return [selected_message]
+        yield sse.token(selected_message)
+        return
 
     # If no text results but we have images, return just the images
     if image_paths:
         image_html = "\n".join([f'<img src="{path}" style="max-width: 100%; margin: 10px 0;">' for path in image_paths])
-        return [image_html]
-
-    return []
+        yield sse.token(image_html)
 
 
+async def warm_up():
+    """Launch the browser pool before the first request; otherwise it is started on first checkout."""
+    await browser_pool.start()